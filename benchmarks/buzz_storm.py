@@ -0,0 +1,155 @@
+"""Simulate a buzz storm and compare broadcast windows.
+
+A host and N players connect; on UNLOCK every player buzzes the moment it
+sees the unlocked state. For each BROADCAST_WINDOW the script reports how
+many state broadcasts the server encoded and queued, how many frames each
+player actually received (outboxes coalesce the rest), how long until every
+player saw the complete queue, and the process CPU time spent. It also checks
+that the queue players see matches the order the server accepted buzzes in.
+
+    python benchmarks/buzz_storm.py --players 50 --rounds 5 --windows 0 0.005 0.01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets  # noqa: E402
+import server  # noqa: E402
+
+
+class Player:
+    def __init__(self, websocket, name):
+        self.websocket = websocket
+        self.name = name
+        self.frames = 0
+        self.buzzed = False
+        self.full_queue = asyncio.Event()
+        self.queue = []
+        self.expected = 0
+
+    async def read(self):
+        try:
+            async for message in self.websocket:
+                if not message.startswith("{"):
+                    continue
+                state = json.loads(message)
+                if "queue" not in state:
+                    continue
+                self.frames += 1
+                if state["buzz_lock"] and not self.buzzed:
+                    self.buzzed = True
+                    await self.websocket.send("BUZZ")
+                self.queue = state["queue"]
+                if self.expected and len(self.queue) == self.expected:
+                    self.full_queue.set()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def storm(url, players_count, rounds):
+    host = await websockets.connect(url)
+    await host.send(f"host:{server.host_password}")
+    players = []
+    for i in range(players_count):
+        websocket = await websockets.connect(url)
+        await websocket.send(f"player{i}")
+        players.append(Player(websocket, f"player{i}"))
+    readers = [asyncio.create_task(player.read()) for player in players]
+    host_reader = asyncio.create_task(drain(host))
+    await asyncio.sleep(0.5)
+
+    durations, frames = [], []
+    orders_match = True
+    broadcasts["count"] = broadcasts["frames"] = 0
+    cpu_start = time.process_time()
+    for _ in range(rounds):
+        for player in players:
+            player.frames = 0
+            player.buzzed = False
+            player.expected = players_count
+            player.full_queue.clear()
+        start = time.perf_counter()
+        await host.send("UNLOCK")
+        await asyncio.gather(*(player.full_queue.wait() for player in players))
+        durations.append((time.perf_counter() - start) * 1000)
+        frames.append(statistics.mean(player.frames for player in players))
+        orders_match &= all(player.queue == server.rooms[server.DEFAULT_ROOM].buzz_queue for player in players)
+        for player in players:
+            player.expected = 0
+        await host.send("LOCK")
+        await asyncio.sleep(0.2)
+    cpu = time.process_time() - cpu_start
+
+    for task in readers + [host_reader]:
+        task.cancel()
+    for player in players:
+        player.websocket.transport.abort()
+    host.transport.abort()
+    return {
+        "storm_ms_p50": round(statistics.median(durations), 2),
+        "storm_ms_max": round(max(durations), 2),
+        "state_broadcasts_per_round": round(broadcasts["count"] / rounds, 1),
+        "frames_queued_per_round": round(broadcasts["frames"] / rounds, 1),
+        "state_frames_received_per_player": round(statistics.mean(frames), 1),
+        "process_cpu_s": round(cpu, 3),
+        "queue_order_matches": orders_match,
+    }
+
+
+broadcasts = {"count": 0, "frames": 0}
+fan_out = server.fan_out
+
+
+def counting_fan_out(targets, message, snapshot=False):
+    if message.startswith("{"):
+        broadcasts["count"] += 1
+        broadcasts["frames"] += len(targets)
+    fan_out(targets, message, snapshot)
+
+
+async def drain(websocket):
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    server.MAX_CLIENTS = args.players + 1
+    server.RATE_LIMIT_MAX_MESSAGES = 10 ** 6
+    server.RATE_LIMIT_MAX_BUZZ = 10 ** 6
+    server.fan_out = counting_fan_out
+
+    results = []
+    for window in args.windows:
+        server.BROADCAST_WINDOW = window
+        ws_server = await websockets.serve(server.handle_client, "127.0.0.1", 0)
+        port = ws_server.sockets[0].getsockname()[1]
+        result = await storm(f"ws://127.0.0.1:{port}", args.players, args.rounds)
+        result = {"broadcast_window": window, **result}
+        results.append(result)
+        ws_server.close()
+        await ws_server.wait_closed()
+        await asyncio.sleep(0.2)
+    print(json.dumps({"players": args.players, "rounds": args.rounds, "results": results}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 0.005, 0.01])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Compare compression policies: CPU per broadcast vs bytes on the wire.
+
+Encodes a run of realistic broadcasts (small and large state snapshots,
+deltas, text and binary drawings) for N recipients through the
+permessage-deflate extension, as websockets would for each socket:
+
+- none: no compression
+- per_connection: websockets' default permessage-deflate (context takeover,
+  12-bit window, memLevel 5), so every socket compresses every frame again
+- shared: SharedDeflate under the server's settings, which skips small and
+  binary frames and compresses each distinct frame once for all sockets
+
+For each it reports encoding CPU per broadcast, wire bytes per recipient and
+the zlib memory each connection keeps between messages.
+
+    python benchmarks/compression.py --recipients 50 200
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from websockets.extensions.permessage_deflate import PerMessageDeflate  # noqa: E402
+from websockets.frames import Frame, Opcode  # noqa: E402
+
+
+def snapshots(rng, players, count):
+    """Successive game-state snapshots as a room would send them"""
+    names = [f"player{i}" for i in range(players)]
+    scores = {name: 0 for name in names}
+    frames = []
+    for version in range(count):
+        scores[rng.choice(names)] += rng.choice([-400, 200, 400, 800])
+        frames.append(json.dumps({
+            "type": "state", "buzz_lock": False, "queue": rng.sample(names, min(5, players)),
+            "player_count": players, "players": names, "scoreboard_enabled": True,
+            "drawing_mode": "off", "version": version, "scores": scores,
+        }))
+    return frames
+
+
+def deltas(rng, count):
+    return [json.dumps({"type": "delta", "base": i, "version": i + 1,
+                        "ops": [["queue_append", f"player{rng.randrange(50)}"]]}) for i in range(count)]
+
+
+def drawings(rng, count, size):
+    """Drawings as text data URLs; PNG data is already compressed, so random bytes stand in"""
+    return [f"DRAWING_SUBMIT:player{i}:data:image/png;base64,{base64.b64encode(rng.randbytes(size)).decode()}"
+            for i in range(count)]
+
+
+def payloads(rng, count, drawing_size):
+    return {
+        "state_8_players": (Opcode.TEXT, snapshots(rng, 8, count)),
+        "state_200_players": (Opcode.TEXT, snapshots(rng, 200, count)),
+        "delta": (Opcode.TEXT, deltas(rng, count)),
+        "drawing_text": (Opcode.TEXT, drawings(rng, count, drawing_size)),
+        "drawing_binary": (Opcode.BINARY, [rng.randbytes(drawing_size) for _ in range(count)]),
+    }
+
+
+def extensions(policy, recipients):
+    if policy == "per_connection":
+        return [PerMessageDeflate(False, False, 12, 12, {"memLevel": 5}) for _ in range(recipients)]
+    settings = {"level": server.COMPRESSION_LEVEL, "memLevel": server.COMPRESSION_MEM_LEVEL}
+    bits = server.COMPRESSION_WINDOW_BITS
+    return [server.SharedDeflate(True, True, bits, bits, settings) for _ in range(recipients)]
+
+
+def broadcast(sockets, opcode, messages, recipients):
+    """Encode every message for every recipient; returns (raw bytes, wire bytes)"""
+    wire = raw = 0
+    for message in messages:
+        for i in range(recipients):
+            data = message.encode() if opcode is Opcode.TEXT else message
+            frame = Frame(opcode, data)
+            if sockets:
+                frame = sockets[i].encode(frame)
+            wire += len(frame.data)
+            raw += len(data)
+    return raw, wire
+
+
+def run(policy, opcode, messages, recipients):
+    server.compressed_frames = server.BlobStore(server.COMPRESSION_CACHE_BYTES)
+    sockets = [] if policy == "none" else extensions(policy, recipients)
+    start = time.perf_counter()
+    raw, wire = broadcast(sockets, opcode, messages, recipients)
+    elapsed = time.perf_counter() - start
+
+    # Memory the sockets keep after the run, apart from the shared cache
+    server.compressed_frames = server.BlobStore(server.COMPRESSION_CACHE_BYTES)
+    tracemalloc.start()
+    sockets = [] if policy == "none" else extensions(policy, recipients)
+    broadcast(sockets, opcode, messages[:2], recipients)
+    kept, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cached = server.compressed_frames.size
+
+    count = len(messages) * recipients
+    return {
+        "policy": policy,
+        "cpu_us_per_broadcast": round(elapsed / len(messages) * 1e6, 1),
+        "wire_bytes_per_frame": round(wire / count),
+        "ratio": round(wire / raw, 3),
+        "kb_kept_per_connection": round((kept - cached) / recipients / 1024, 1) if sockets else 0,
+        "shared_cache_kb": round(cached / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--messages", type=int, default=20, help="broadcasts of each kind")
+    parser.add_argument("--drawing-kb", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    results = []
+    for name, (opcode, messages) in payloads(rng, args.messages, args.drawing_kb * 1024).items():
+        raw_bytes = len(messages[0].encode() if opcode is Opcode.TEXT else messages[0])
+        for recipients in args.recipients:
+            for policy in ("none", "per_connection", "shared"):
+                results.append({"payload": name, "raw_bytes": raw_bytes, "recipients": recipients,
+                                **run(policy, opcode, messages, recipients)})
+
+    print(json.dumps({"min_size": server.COMPRESSION_MIN_SIZE, "window_bits": server.COMPRESSION_WINDOW_BITS,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Measure message parse and dispatch cost, and compact encoding sizes.
+
+Three measurements:
+
+- lookup: finding the handler for a message. The old handle_message tested
+  each command in turn (== and startswith) until one matched; dispatch()
+  does one COMMANDS lookup on the prefix. Handlers are replaced by no-ops so
+  only the parse, lookup and permission check are timed.
+- handle: the full handler path for common messages (PING, BUZZ, an unknown
+  command) in text and compact form, on a real room with one client.
+- encode: size and encode time of a delta frame as JSON and as a compact
+  binary frame.
+
+    python benchmarks/dispatch.py --iterations 200000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def noop(websocket, client_data, arg, message):
+    pass
+
+
+def legacy_dispatch(websocket, client_data, message):
+    """The old if/elif chain: each command tested in turn, as handle_message did"""
+    room = client_data.room
+
+    if message == "PING":
+        noop(websocket, client_data, None, message)
+    elif message == "BUZZ":
+        noop(websocket, client_data, None, message)
+    elif message == "BOOT" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "WIN" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "LOCK" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "UNLOCK" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "FINAL" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "WAGER_REQUEST" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "RESET_GAME" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("TOGGLE_SCOREBOARD:") and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("SCORE_UPDATE:") and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("FINAL_ANSWER:") and websocket != room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("WAGER:") and websocket != room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("DRAWING_MODE:") and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "CLEAR_DRAWINGS" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("STROKES:") and websocket != room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "STROKES_CLEAR" and websocket != room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "STROKE_REPLAY":
+        noop(websocket, client_data, None, message)
+    elif message.startswith("DRAWING_SUBMIT:") and websocket != room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message.startswith("DRAWING_FETCH:"):
+        noop(websocket, client_data, None, message)
+    elif message.startswith("FEATURES:"):
+        noop(websocket, client_data, None, message)
+    elif message == "SNAPSHOT":
+        noop(websocket, client_data, None, message)
+    elif message == "QUEUE_STATS" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    elif message == "CLOSE_ROOM" and websocket == room.host_socket:
+        noop(websocket, client_data, None, message)
+    else:
+        server.logger.warning(f"Unknown message from {client_data.username}: {message[:100]}")
+        server.safe_send(websocket, json.dumps({"error": "Unknown message type"}))
+
+def per_call_ns(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return round((time.perf_counter() - start) / iterations * 1e9)
+
+
+class Room:
+    host_socket = None
+
+
+class Client:
+    def __init__(self, room):
+        self.room = room
+        self.username = "player"
+        self.features = set()
+
+
+def lookup_results(iterations):
+    """Old chain vs table lookup, with no-op handlers"""
+    real_commands = dict(server.COMMANDS)
+    for prefix, (handler, allowed) in real_commands.items():
+        server.COMMANDS[prefix] = (noop, allowed)
+    room = Room()
+    client = Client(room)
+    host = object()  # neither socket is connected, so replies are dropped
+    player = object()
+    room.host_socket = host
+    messages = [
+        ("PING", player), ("BUZZ", player), ("SCORE_UPDATE:player:200", host),
+        ("WAGER:player:1000", player), ("SNAPSHOT", player), ("CLOSE_ROOM", host), ("NOT_A_COMMAND", player),
+    ]
+    try:
+        return [
+            {
+                "message": message,
+                "legacy_ns": per_call_ns(lambda: legacy_dispatch(websocket, client, message), iterations),
+                "table_ns": per_call_ns(lambda: server.dispatch(websocket, client, message), iterations),
+            }
+            for message, websocket in messages
+        ]
+    finally:
+        server.COMMANDS.update(real_commands)
+
+
+async def handle_results(iterations):
+    """Full handler cost on a real room, for text and compact clients"""
+    server.RATE_LIMIT_MAX_BUZZ = 10 ** 9
+    room = server.get_room("dispatch-bench")
+    websocket = object()
+    outbox = server.Outbox()
+    client = server.ClientState(room, outbox, None)
+    client.username = "player"
+    server.client_info[websocket] = client
+    room.clients[websocket] = None
+
+    def run(handle, message):
+        def step():
+            handle(websocket, message, "player")
+            if outbox.depth() > 100:
+                outbox.frames.clear()
+                outbox.size = 0
+                outbox.snapshot = None
+        return per_call_ns(step, iterations)
+
+    def drive(handler):
+        # The message handlers are coroutines that never await; run them directly
+        def handle(websocket, message, username):
+            try:
+                handler(websocket, message, username).send(None)
+            except StopIteration:
+                pass
+        return handle
+
+    text = drive(server.handle_message)
+    binary = drive(server.handle_binary_message)
+
+    results = []
+    for features, label, handle, messages in [
+        (set(), "text", text, {"PING": "PING", "BUZZ": "BUZZ", "unknown": "NOT_A_COMMAND"}),
+        ({'compact'}, "compact", binary, {"PING": bytes((server.BINARY_PING,)), "BUZZ": bytes((server.BINARY_BUZZ,))}),
+    ]:
+        client.features = features
+        for name, message in messages.items():
+            results.append({"message": name, "encoding": label, "ns": run(handle, message)})
+
+    del server.client_info[websocket]
+    room.clients.clear()
+    server.close_room(room)
+    return results
+
+
+def encode_results(iterations):
+    """JSON vs compact delta frames for typical updates"""
+    scores = {f"player{i}": i * 200 for i in range(20)}
+    updates = {
+        "buzz": [("queue_append", "player7")],
+        "win": [("queue_clear",), ("lock", False), ("win", "player7")],
+        "score": [("score", "player7", 400)],
+        "scoreboard_on": [("scoreboard", True), ("scores", scores)],
+    }
+    results = []
+    for name, ops in updates.items():
+        json_frame = json.dumps({"type": "delta", "base": 41, "version": 42, "ops": ops})
+        compact_frame = server.encode_compact_delta(41, 42, ops)
+        results.append({
+            "update": name,
+            "json_bytes": len(json_frame.encode()),
+            "compact_bytes": len(compact_frame),
+            "json_encode_ns": per_call_ns(
+                lambda: json.dumps({"type": "delta", "base": 41, "version": 42, "ops": ops}), iterations // 10),
+            "compact_encode_ns": per_call_ns(lambda: server.encode_compact_delta(41, 42, ops), iterations // 10),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(json.dumps({
+        "iterations": args.iterations,
+        "lookup": lookup_results(args.iterations),
+        "handle": asyncio.run(handle_results(args.iterations)),
+        "encode": encode_results(args.iterations),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
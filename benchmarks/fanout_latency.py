@@ -0,0 +1,144 @@
+"""Measure worst-case state delivery latency of the broadcast fan-out.
+
+Starts the server in-process on an ephemeral port, connects a host and
+N players, then toggles the buzzer and records how long it takes for the
+resulting state update to reach every player. Optional stalled players stop
+reading from their socket to show that one laggard no longer holds up the rest.
+
+    python benchmarks/fanout_latency.py --players 60 --rounds 20 --stalled 2
+"""
+import argparse
+import base64
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets  # noqa: E402
+import server  # noqa: E402
+
+
+async def connect(port, username, rcvbuf=None):
+    sock = None
+    if rcvbuf:
+        # A small fixed receive buffer disables autotuning so a stalled
+        # reader backs up the server after a few frames
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.connect(("127.0.0.1", port))
+    websocket = await websockets.connect(f"ws://127.0.0.1:{port}", max_size=None, sock=sock)
+    await websocket.send(username)
+    return websocket
+
+
+async def drain_until(websocket, predicate):
+    """Read frames until one satisfies predicate, return its arrival time"""
+    while True:
+        message = await websocket.recv()
+        if predicate(message):
+            return time.perf_counter()
+
+
+async def drain_count(websocket, prefix, count):
+    while count:
+        message = await websocket.recv()
+        if message.startswith(prefix):
+            count -= 1
+
+
+def state_with_lock(locked):
+    def predicate(message):
+        if not message.startswith("{"):
+            return False
+        state = json.loads(message)
+        return state.get("buzz_lock") is locked
+    return predicate
+
+
+async def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    server.MAX_CLIENTS = args.players + args.stalled + 1
+    server.SEND_TIMEOUT = args.send_timeout
+    server.RATE_LIMIT_MAX_DRAWINGS = max(args.flood, 1)
+
+    ws_server = await websockets.serve(server.handle_client, "127.0.0.1", 0, max_size=None)
+    port = ws_server.sockets[0].getsockname()[1]
+
+    host = await connect(port, f"host:{server.host_password}")
+    players = [await connect(port, f"player{i}") for i in range(args.players)]
+    stalled = [await connect(port, f"stalled{i}", rcvbuf=16384) for i in range(args.stalled)]
+    await asyncio.sleep(0.5)
+
+    # Stalled players stop reading; their kernel buffers fill up as the
+    # drawing broadcasts below arrive
+    for websocket in stalled:
+        websocket.transport.pause_reading()
+
+    host_reader = asyncio.create_task(drain_forever(host))
+
+    if args.stalled:
+        # Push large frames so stalled sockets actually back up
+        await host.send("DRAWING_MODE:ON")
+        await asyncio.sleep(0.2)
+        # Random payload so permessage-deflate cannot shrink it away
+        image = base64.b64encode(os.urandom(args.drawing_kb * 768)).decode()
+        drawing = "DRAWING_SUBMIT:" + json.dumps({"username": "player0", "timestamp": 0, "imageData": image})
+        for _ in range(args.flood):
+            await players[0].send(drawing)
+        # Let the healthy players consume the flood before timing starts
+        await asyncio.gather(*(drain_count(ws, "DRAWING_SUBMIT:", args.flood) for ws in players))
+
+    worst, median = [], []
+    for round_number in range(args.rounds):
+        locked = round_number % 2 == 0
+        waiters = [asyncio.create_task(drain_until(ws, state_with_lock(locked))) for ws in players]
+        start = time.perf_counter()
+        await host.send("UNLOCK" if locked else "LOCK")
+        done = await asyncio.gather(*waiters)
+        latencies = [(t - start) * 1000 for t in done]
+        worst.append(max(latencies))
+        median.append(statistics.median(latencies))
+
+    host_reader.cancel()
+    result = {
+        "players": args.players,
+        "stalled": args.stalled,
+        "rounds": args.rounds,
+        "worst_case_ms_max": round(max(worst), 3),
+        "worst_case_ms_p50": round(statistics.median(worst), 3),
+        "median_ms_p50": round(statistics.median(median), 3),
+    }
+    print(json.dumps(result, indent=2))
+
+    for websocket in players + stalled + [host]:
+        websocket.transport.abort()
+    ws_server.close()
+
+
+async def drain_forever(websocket):
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--stalled", type=int, default=0, help="players that stop reading their socket")
+    parser.add_argument("--drawing-kb", type=int, default=400, help="size of flood drawings when --stalled is set")
+    parser.add_argument("--flood", type=int, default=20, help="drawings sent to back up stalled sockets")
+    parser.add_argument("--send-timeout", type=float, default=server.SEND_TIMEOUT)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Measure game pack loading, board memory and clue reveal size.
+
+Writes a synthetic pack (rounds of six categories of five clues, some with
+an image) to a temporary PACK_DIR and times load_pack():
+
+- cold: JSON parsed, checked and compiled, and the compiled board saved
+- compiled: read back from the compiled cache, as after a server restart
+- loaded: already in memory, as when another room loads the same pack
+
+It also reports the memory of the compiled board against the parsed JSON,
+the size of a CLUE reveal against sending the clue with its image inline,
+and the time to serve a media file from disk and then from media_store.
+
+    python benchmarks/game_pack.py --rounds 2 40 400
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+WORDS = "the of a river capital novel element painter composer war treaty island mountain planet".split()
+
+
+def write_pack(directory, rounds, media_every, media_kb, rng):
+    """Write a pack with its media; returns the pack's size in bytes"""
+    os.makedirs(os.path.join(directory, "bench", "media"))
+    media = 0
+    document = {"title": "Benchmark", "rounds": []}
+    for r in range(rounds):
+        categories = []
+        for c in range(6):
+            clues = []
+            for i in range(5):
+                clue = {"value": 200 * (i + 1), "clue": " ".join(rng.choices(WORDS, k=20)),
+                        "answer": " ".join(rng.choices(WORDS, k=3))}
+                if (r * 30 + c * 5 + i) % media_every == 0:
+                    clue["media"] = f"media/{media}.png"
+                    with open(os.path.join(directory, "bench", clue["media"]), "wb") as media_file:
+                        media_file.write(b"\x89PNG\r\n\x1a\n" + rng.randbytes(media_kb * 1024))
+                    media += 1
+                clues.append(clue)
+            categories.append({"name": f"Category {r}-{c}", "clues": clues})
+        document["rounds"].append({"name": f"Round {r + 1}", "categories": categories})
+    data = json.dumps(document).encode()
+    with open(os.path.join(directory, "bench.json"), "wb") as pack_file:
+        pack_file.write(data)
+    return data
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def allocated(function):
+    tracemalloc.start()
+    result = function()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def run(rounds, media_every, media_kb, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        server.PACK_DIR = directory
+        server.PACK_CACHE_DIR = os.path.join(directory, ".compiled")
+        server.loaded_packs.clear()
+        data = write_pack(directory, rounds, media_every, media_kb, rng)
+
+        _, cold = timed(server.load_pack, "bench")
+        server.loaded_packs.clear()
+        _, compiled = timed(server.load_pack, "bench")
+        pack, loaded = timed(server.load_pack, "bench")
+
+        server.loaded_packs.clear()
+        _, board_bytes = allocated(lambda: server.load_pack("bench"))
+        _, json_bytes = allocated(lambda: json.loads(data))
+
+        clue = next(i for i, media in enumerate(pack.clue_media) if media >= 0)
+        reveal = pack.clue_frame(clue)
+        image, from_disk = timed(pack.read_media, pack.clue_media[clue])
+        inline = json.dumps({"type": "clue", "id": clue, "text": pack.clues[clue], "value": pack.values[clue],
+                             "answer": pack.answers[clue],
+                             "media": f"data:image/png;base64,{base64.b64encode(image).decode()}"})
+        key = (pack.digest, pack.name, pack.clue_media[clue], False)
+        server.media_store.put(key, server.media_frame(pack, pack.clue_media[clue], image, False))
+        _, from_cache = timed(server.media_store.get, key)
+
+    return {
+        "clues": len(pack.clues),
+        "media_files": len(pack.media_paths),
+        "pack_kb": round(len(data) / 1024, 1),
+        "cold_load_ms": round(cold, 2),
+        "compiled_load_ms": round(compiled, 2),
+        "loaded_ms": round(loaded, 3),
+        "board_kb": round(board_bytes / 1024, 1),
+        "parsed_json_kb": round(json_bytes / 1024, 1),
+        "reveal_bytes": len(reveal),
+        "inline_reveal_bytes": len(inline),
+        "media_from_disk_ms": round(from_disk, 3),
+        "media_from_cache_ms": round(from_cache, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[2, 40, 400], help="rounds of 30 clues")
+    parser.add_argument("--media-every", type=int, default=10, help="one clue in this many has an image")
+    parser.add_argument("--media-kb", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = [run(rounds, args.media_every, args.media_kb, args.seed) for rounds in args.rounds]
+    print(json.dumps({"results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Measure the game journal: cost on the event loop and recovery time.
+
+Plays a stream of game events (joins, buzzes, score changes, locks) across
+several rooms through a real GameJournal in a temporary directory, yielding
+to the event loop every few events as message handling would. Then it stops
+the writer without a final snapshot, as a crash would, and times
+recover_rooms() on the result, checking the recovered rooms match.
+
+Each event count runs twice: with snapshots every JOURNAL_SNAPSHOT_EVERY
+events, where recovery reads one snapshot and a short tail, and with
+snapshots off, where recovery replays the whole game.
+
+    python benchmarks/journal_recovery.py --events 1000 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def next_event(rng, room, players):
+    """A plausible next event for a room, with its arguments"""
+    roll = rng.random()
+    if roll < 0.05 or not room.player_scores:
+        return "player", (rng.choice(players),)
+    if roll < 0.15:
+        return ("unlock", ()) if not room.buzz_lock else ("lock", ())
+    if roll < 0.55:
+        return "buzz", (rng.choice(players),)
+    if roll < 0.65:
+        return "boot", ()
+    if roll < 0.70:
+        return "win", ()
+    if roll < 0.95:
+        return "score", (rng.choice(list(room.player_scores)), rng.choice([-400, -200, 200, 400, 800]))
+    return "scoreboard", (rng.random() < 0.5,)
+
+
+async def play(directory, events, rooms, yield_every, seed):
+    """Play events through a journal; returns (loop seconds spent journaling, commits)"""
+    rng = random.Random(seed)
+    players = [f"player{i}" for i in range(20)]
+    game_rooms = [server.get_room(f"room{i}") for i in range(rooms)]
+    journal = server.game_journal = server.GameJournal(directory)
+    journaling = 0.0
+    for i in range(events):
+        room = rng.choice(game_rooms)
+        event, args = next_event(rng, room, players)
+        room.apply_event(event, args)
+        start = time.perf_counter()
+        room.journal(event, *args)
+        journaling += time.perf_counter() - start
+        if i % yield_every == 0:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    # Crash: write out what was queued, but no final snapshot
+    journal.queue.put(None)
+    journal.writer.join()
+    server.game_journal = None
+    return journaling, journal.commits
+
+
+def room_states():
+    return json.loads(json.dumps({code: room.journal_state() for code, room in server.rooms.items()}))
+
+
+def run(events, snapshot_every, rooms, yield_every, seed):
+    server.JOURNAL_SNAPSHOT_EVERY = snapshot_every
+    server.rooms.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        journaling, commits = asyncio.run(play(directory, events, rooms, yield_every, seed))
+        expected = room_states()
+        journal_bytes = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+        )
+
+        server.rooms.clear()
+        start = time.perf_counter()
+        sequence = server.recover_rooms(directory)
+        recovery = time.perf_counter() - start
+        recovered = room_states()
+    server.rooms.clear()
+
+    return {
+        "events": events,
+        "snapshot_every": snapshot_every if snapshot_every <= events else None,
+        "append_us_per_event": round(journaling / events * 1e6, 2),
+        "events_per_fsync": round(events / commits, 1) if commits else None,
+        "bytes_on_disk": journal_bytes,
+        "recovery_ms": round(recovery * 1000, 2),
+        "recovered_sequence": sequence,
+        "state_matches": recovered == expected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--yield-every", type=int, default=20, help="events between returns to the event loop")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    snapshot_every = server.JOURNAL_SNAPSHOT_EVERY
+    results = []
+    for events in args.events:
+        for every in (snapshot_every, events + 1):  # events + 1: never snapshot
+            results.append(run(events, every, args.rooms, args.yield_every, args.seed))
+
+    print(json.dumps({"snapshot_every": snapshot_every, "rooms": args.rooms, "results": results}, indent=2))
+    sys.exit(0 if all(result["state_matches"] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"""Load generator: a host and hundreds of players against a real server.
+
+Starts server.py in a subprocess (or targets a running one with --url) and
+runs scripted scenarios, each in its own room:
+
+- buzz_storm: the host unlocks, every player buzzes the moment it sees the
+  buzzer open, the host locks again. Measures state delivery (UNLOCK sent
+  to each player seeing it) and buzz-to-ack (BUZZ sent to the player seeing
+  itself in the queue, or a PENALTY).
+- drawing_round: the host turns drawing mode on and --drawers players submit
+  a DRAWING_SUBMIT of --drawing-kb each, relayed to the whole room. Measures
+  submit-to-host latency and the bytes delivered.
+- reconnect_storm: every player drops its connection and reconnects at once,
+  resuming its session with its token (or, with --no-resume, joining again
+  by name). Measures connect-to-first-state latency, failed connections and
+  sessions resumed.
+- scoreboard: the host turns the scoreboard on and sends SCORE_UPDATEs one
+  after another. Measures update sent to each player seeing the new score.
+
+With --spectators N, N read-only spectators (?spectate) also watch each
+scenario's room, so player latency can be compared with and without an
+audience.
+
+Each scenario reports latency percentiles, timeouts, messages per second,
+and the server's CPU time and peak RSS (from /proc, Linux only). Results are
+printed and written to --output as JSON, with the git commit and settings,
+so runs can be compared over time.
+
+    python benchmarks/loadgen.py --players 200 --scenarios buzz_storm scoreboard
+    python benchmarks/loadgen.py --set MAX_CLIENTS=500 BROADCAST_WINDOW=0.01
+    python benchmarks/loadgen.py --url ws://127.0.0.1:9999 --password secret --server-pid 1234
+
+The launched server keeps its own limits except MAX_CLIENTS, which is raised
+to fit --players; rate-limited messages show up as penalties or timeouts.
+"""
+import argparse
+import ast
+import asyncio
+import base64
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadgen"
+
+LAUNCHER = """
+import asyncio, sys
+sys.path.insert(0, {root!r})
+import server
+for name, value in {overrides!r}.items():
+    setattr(server, name, value)
+asyncio.run(server.main("127.0.0.1", {port}))
+"""
+
+SCENARIOS = ("buzz_storm", "drawing_round", "reconnect_storm", "scoreboard")
+
+
+class Counters:
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.bytes_received = 0
+
+
+class Client:
+    """One simulated connection; reads frames in the background
+
+    expect() registers a condition on frames still to come and returns a
+    future resolved with the arrival time of the first frame that meets it.
+    Register before sending whatever should cause the frame.
+    """
+
+    def __init__(self, name, websocket, counters):
+        self.name = name
+        self.websocket = websocket
+        self.counters = counters
+        self.waiters = []
+        self.token = None  # session token, for RESUME
+        self.resumed = False
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        try:
+            async for message in self.websocket:
+                arrived = time.perf_counter()
+                self.counters.received += 1
+                self.counters.bytes_received += len(message)
+                if isinstance(message, str) and message.startswith(('{"type": "session"', '{"type": "resumed"')):
+                    self.token = json.loads(message)["token"]
+                    self.resumed = message.startswith('{"type": "resumed"')
+                state = None
+                if self.waiters and isinstance(message, str) and message.startswith("{"):
+                    state = json.loads(message)
+                    if "queue" not in state:
+                        state = None
+                for waiter in list(self.waiters):
+                    future, condition = waiter
+                    if future.done():
+                        self.waiters.remove(waiter)
+                    elif condition(message, state):
+                        future.set_result(arrived)
+                        self.waiters.remove(waiter)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def expect(self, condition):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((future, condition))
+        return future
+
+    async def send(self, message):
+        self.counters.sent += 1
+        await self.websocket.send(message)
+
+    def abort(self):
+        self.reader.cancel()
+        self.websocket.transport.abort()
+
+
+async def arrival(future, timeout):
+    """Arrival time from an expect() future, or None if it timed out"""
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda fraction: round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 2)
+    return {"count": len(ordered), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99),
+            "max": round(ordered[-1] * 1000, 2), "mean": round(statistics.mean(ordered) * 1000, 2)}
+
+
+def process_usage(pid):
+    """(CPU seconds, RSS bytes) of a process, or (None, None) where /proc is not available"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        return cpu, int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None, None
+
+
+class Session:
+    """Connections to one room, plus the settings every scenario shares"""
+
+    def __init__(self, args, room):
+        self.args = args
+        self.url = f"{args.url.rstrip('/')}/{room}"
+        self.counters = Counters()
+        self.spectator_counters = Counters()
+        self.host = None
+        self.players = []
+        self.spectators = []
+        self.connect_gate = asyncio.Semaphore(args.connect_concurrency)
+
+    async def connect(self, name, token=None):
+        """Connect and join (or resume a session); returns (Client, seconds to first state) or (None, None)"""
+        login = f"RESUME:{token}" if token else f"host:{self.args.password}" if name == "host" else name
+        start = time.perf_counter()
+        try:
+            async with self.connect_gate:
+                websocket = await websockets.connect(self.url, max_size=None, open_timeout=self.args.timeout)
+            client = Client(name, websocket, self.counters)
+            joined = client.expect(lambda message, state: state is not None)
+            await client.send(login)
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+            return None, None
+        seen = await arrival(joined, self.args.timeout)
+        if seen is None:
+            client.abort()
+            return None, None
+        return client, seen - start
+
+    async def join_all(self):
+        """Connect the host and every player; returns join latencies"""
+        self.host, _ = await self.connect("host")
+        if self.host is None:
+            raise RuntimeError(f"host could not join {self.url}")
+        joined = await asyncio.gather(*(self.connect(f"player{i}") for i in range(self.args.players)))
+        self.players = [client for client, _ in joined if client is not None]
+        spectators = await asyncio.gather(*(self.connect_spectator(i) for i in range(self.args.spectators)))
+        self.spectators = [client for client in spectators if client is not None]
+        return [latency for _, latency in joined if latency is not None]
+
+    async def connect_spectator(self, index):
+        query = "?spectate=zlib" if self.args.spectator_format == "zlib" else "?spectate"
+        try:
+            async with self.connect_gate:
+                websocket = await websockets.connect(self.url + query, max_size=None, open_timeout=self.args.timeout)
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+            return None
+        return Client(f"spectator{index}", websocket, self.spectator_counters)
+
+    def close(self):
+        for client in self.players + self.spectators + [self.host]:
+            if client is not None:
+                client.abort()
+
+
+async def buzz_storm(session, args):
+    host, players = session.host, session.players
+    delivery, acks = [], []
+    penalties = timeouts = 0
+    for _ in range(args.rounds):
+        unlocked = [player.expect(lambda message, state: state is not None and state["buzz_lock"])
+                    for player in players]
+        start = time.perf_counter()
+        await host.send("UNLOCK")
+
+        async def play(player, seen_unlock):
+            nonlocal timeouts
+            seen = await arrival(seen_unlock, args.timeout)
+            if seen is None:
+                timeouts += 1
+                return
+            delivery.append(seen - start)
+            acked = player.expect(lambda message, state: message == "PENALTY" or
+                                  (state is not None and player.name in state["queue"]))
+            sent = time.perf_counter()
+            await player.send("BUZZ")
+            seen = await arrival(acked, args.timeout)
+            if seen is None:
+                timeouts += 1
+                return
+            acks.append(seen - sent)
+
+        penalty_waiters = [player.expect(lambda message, state: message == "PENALTY") for player in players]
+        await asyncio.gather(*(play(player, seen) for player, seen in zip(players, unlocked)))
+        penalties += sum(1 for waiter in penalty_waiters if waiter.done())
+        for waiter in penalty_waiters:
+            waiter.cancel()
+
+        locked = host.expect(lambda message, state: state is not None and not state["buzz_lock"])
+        await host.send("LOCK")
+        await arrival(locked, args.timeout)
+        await asyncio.sleep(args.round_gap)
+    return {"state_delivery_ms": percentiles(delivery), "buzz_ack_ms": percentiles(acks),
+            "penalties": penalties, "timeouts": timeouts}
+
+
+async def drawing_round(session, args):
+    host, players = session.host, session.players
+    drawers = players[:args.drawers]
+    image = "data:image/png;base64," + base64.b64encode(os.urandom(args.drawing_kb * 768)).decode()
+    latencies = []
+    rejected = timeouts = 0
+    for _ in range(args.rounds):
+        await host.send("DRAWING_MODE:ON")
+        await asyncio.sleep(0.2)
+
+        async def submit(player):
+            nonlocal rejected, timeouts
+            # The username comes first so the host side can match it without parsing the image
+            marker = f'DRAWING_SUBMIT:{{"username": "{player.name}"'
+            received = host.expect(lambda message, state: isinstance(message, str) and message.startswith(marker))
+            # Rate-limited or invalid submissions are answered with an error
+            refused = player.expect(lambda message, state: isinstance(message, str) and message.startswith('{"error"'))
+            drawing = json.dumps({"username": player.name, "timestamp": time.time() * 1000, "imageData": image})
+            sent = time.perf_counter()
+            await player.send("DRAWING_SUBMIT:" + drawing)
+            done, _ = await asyncio.wait({received, refused}, timeout=args.timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            received.cancel()
+            refused.cancel()
+            if received in done:
+                latencies.append(received.result() - sent)
+            elif refused in done:
+                rejected += 1
+            else:
+                timeouts += 1
+
+        await asyncio.gather(*(submit(player) for player in drawers))
+        await host.send("DRAWING_MODE:OFF")
+        await asyncio.sleep(args.round_gap)
+    return {"submit_to_host_ms": percentiles(latencies), "drawing_bytes": len(image) + 40,
+            "drawers": len(drawers), "rejected": rejected, "timeouts": timeouts}
+
+
+async def reconnect_storm(session, args):
+    latencies = []
+    failed = resumed = 0
+    for _ in range(args.rounds):
+        logins = [(player.name, None if args.no_resume else player.token) for player in session.players]
+        for player in session.players:
+            player.abort()
+        session.players = []
+        await asyncio.sleep(0.2)
+        joined = await asyncio.gather(*(session.connect(name, token) for name, token in logins))
+        session.players = [client for client, _ in joined if client is not None]
+        latencies += [latency for _, latency in joined if latency is not None]
+        failed += len(logins) - len(session.players)
+        resumed += sum(player.resumed for player in session.players)
+        await asyncio.sleep(args.round_gap)
+    return {"reconnect_ms": percentiles(latencies), "failed_connections": failed, "resumed": resumed}
+
+
+async def scoreboard(session, args):
+    host, players = session.host, session.players
+    shown = host.expect(lambda message, state: state is not None and state["scoreboard_enabled"])
+    await host.send("TOGGLE_SCOREBOARD:ON")
+    await arrival(shown, args.timeout)
+
+    scores = {player.name: 0 for player in players}
+    delivery = []
+    timeouts = 0
+    for update in range(args.score_updates):
+        target = players[update % len(players)].name
+        scores[target] += 100
+        expected = scores[target]
+        seen_by = [player.expect(lambda message, state: state is not None and
+                                 state.get("scores", {}).get(target) == expected) for player in players]
+        start = time.perf_counter()
+        await host.send(f"SCORE_UPDATE:{target}:100")
+        for seen in await asyncio.gather(*(arrival(future, args.timeout) for future in seen_by)):
+            if seen is None:
+                timeouts += 1
+            else:
+                delivery.append(seen - start)
+    return {"score_delivery_ms": percentiles(delivery), "updates": args.score_updates, "timeouts": timeouts}
+
+
+async def run_scenario(name, args, server_pid):
+    session = Session(args, f"lg-{name}-{int(time.time()) % 100000}")
+    join_latencies = await session.join_all()
+    if not session.players:
+        session.close()
+        raise RuntimeError(f"no players could join {session.url}")
+
+    peak_rss = 0
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            _, rss = process_usage(server_pid)
+            peak_rss = max(peak_rss, rss or 0)
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_rss())
+    for counters in (session.counters, session.spectator_counters):
+        counters.sent = counters.received = counters.bytes_received = 0
+    server_cpu_start, _ = process_usage(server_pid)
+    loadgen_cpu_start = time.process_time()
+    start = time.perf_counter()
+    try:
+        result = await globals()[name](session, args)
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        session.close()
+    server_cpu, rss = process_usage(server_pid)
+    counters = session.counters
+    await asyncio.sleep(0.5)  # let the server clean up before the next scenario
+    return {
+        "scenario": name,
+        "players": len(session.players),
+        "spectators": len(session.spectators),
+        "join_ms": percentiles(join_latencies),
+        **result,
+        "duration_s": round(elapsed, 3),
+        "messages_sent": counters.sent,
+        "messages_received": counters.received,
+        "messages_per_s": round((counters.sent + counters.received) / elapsed, 1),
+        "mb_received": round(counters.bytes_received / 1e6, 2),
+        "spectator_frames_received": session.spectator_counters.received,
+        "spectator_mb_received": round(session.spectator_counters.bytes_received / 1e6, 2),
+        "server_cpu_s": round(server_cpu - server_cpu_start, 3) if server_cpu is not None else None,
+        "server_rss_mb_peak": round(max(peak_rss, rss or 0) / 1e6, 1) if rss is not None else None,
+        "loadgen_cpu_s": round(time.process_time() - loadgen_cpu_start, 3),
+    }
+
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not open port {port}")
+
+
+def parse_overrides(settings):
+    """NAME=VALUE pairs for server.py constants, values as Python literals"""
+    overrides = {}
+    for setting in settings:
+        name, _, value = setting.partition("=")
+        try:
+            overrides[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            overrides[name] = value
+    return overrides
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, server_pid):
+    results = []
+    for name in args.scenarios:
+        results.append(await run_scenario(name, args, server_pid))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--spectators", type=int, default=0, help="read-only spectators per scenario room")
+    parser.add_argument("--no-resume", action="store_true", help="reconnect_storm joins by name instead of resuming")
+    parser.add_argument("--spectator-format", choices=("json", "zlib"), default="json")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds per scenario")
+    parser.add_argument("--round-gap", type=float, default=1.0, help="seconds between rounds")
+    parser.add_argument("--drawers", type=int, default=20, help="players submitting in drawing_round")
+    parser.add_argument("--drawing-kb", type=int, default=100, help="size of each drawing submission")
+    parser.add_argument("--score-updates", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for any one response")
+    parser.add_argument("--connect-concurrency", type=int, default=50, help="connections opened at once")
+    parser.add_argument("--set", nargs="+", default=[], metavar="NAME=VALUE",
+                        help="server.py constants for the launched server")
+    parser.add_argument("--port", type=int, default=9980, help="port for the launched server")
+    parser.add_argument("--url", help="use a running server instead of launching one")
+    parser.add_argument("--password", help="host password of the --url server")
+    parser.add_argument("--server-pid", type=int, help="pid of the --url server, for CPU and RSS")
+    parser.add_argument("--output", default="loadgen_results.json")
+    args = parser.parse_args()
+
+    overrides = {"MAX_CLIENTS": args.players + 1, **parse_overrides(args.set)}
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.url is None:
+            args.url = f"ws://127.0.0.1:{args.port}"
+            args.password = PASSWORD
+            code = LAUNCHER.format(root=ROOT, overrides=overrides, port=args.port)
+            process = subprocess.Popen([sys.executable, "-c", code], cwd=workdir,
+                                       env=dict(os.environ, HOST_PASSWORD=PASSWORD),
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            server_pid = process.pid
+        else:
+            overrides = None
+            server_pid = args.server_pid
+        try:
+            if process is not None:
+                wait_for_port(args.port)
+            results = asyncio.run(run(args, server_pid))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("password", "set")},
+        "server_overrides": overrides,
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
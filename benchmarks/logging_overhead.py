@@ -0,0 +1,147 @@
+"""Measure how long logging blocks the event loop.
+
+Runs a burst of game-style log calls inside an event loop, once with the old
+synchronous setup (FileHandler + StreamHandler written from the loop) and
+once with the queue pipeline from configure_logging(). For each it reports
+time spent inside log calls (the time the loop was blocked by logging) and
+the worst lateness of a 1 ms ticker running alongside. --slow-ms adds a
+delay to every file write to simulate a slow or contended disk; the queue
+pipeline then drops info records instead of stalling. Console output goes to
+a temporary file in both modes.
+
+    python benchmarks/logging_overhead.py --calls 20000 --slow-ms 0 1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def slow_down(handler, delay):
+    """Make every write by handler take at least delay seconds"""
+    if delay <= 0:
+        return
+    emit = handler.emit
+
+    def slow_emit(record):
+        time.sleep(delay)
+        emit(record)
+    handler.emit = slow_emit
+
+
+def configure_sync(directory, delay):
+    """The previous setup: handlers called directly from the event loop"""
+    server.stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    file_handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+    slow_down(file_handler, delay)
+    console_handler = logging.StreamHandler(open(os.path.join(directory, "sync.console"), "w"))
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        root.addHandler(handler)
+    return lambda: [handler.close() for handler in (file_handler, console_handler)]
+
+
+def configure_queue(directory, delay):
+    stderr = sys.stderr
+    sys.stderr = open(os.path.join(directory, "queue.console"), "w")
+    try:
+        server.configure_logging(os.path.join(directory, "queue.log"))
+    finally:
+        sys.stderr = stderr
+    slow_down(server.log_listener.handlers[0], delay)
+    return server.stop_logging
+
+
+async def burst(calls):
+    """Log like a busy room while a ticker measures loop lateness"""
+    logger = server.logger
+    lateness = []
+    done = False
+
+    async def ticker():
+        while not done:
+            expected = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            lateness.append(time.perf_counter() - expected)
+
+    tick_task = asyncio.create_task(ticker())
+    blocked = []
+    for i in range(calls):
+        start = time.perf_counter()
+        logger.info("%s buzzed in!", f"player{i % 50}")
+        logger.debug("Queue is now %s", i)  # filtered out at INFO
+        if i % 10 == 0:
+            logger.warning("Rate limit exceeded for %s", f"player{i % 50}")
+        blocked.append(time.perf_counter() - start)
+        if i % 50 == 0:
+            await asyncio.sleep(0)  # let the ticker run, as message handling would
+    done = True
+    await tick_task
+    return blocked, lateness
+
+
+def summarize(blocked, lateness):
+    blocked_sorted = sorted(blocked)
+    return {
+        "blocked_ms_total": round(sum(blocked) * 1000, 1),
+        "blocked_us_per_message_p50": round(statistics.median(blocked) * 1e6, 1),
+        "blocked_us_per_message_p99": round(blocked_sorted[int(len(blocked) * 0.99)] * 1e6, 1),
+        "blocked_ms_max": round(blocked_sorted[-1] * 1000, 2),
+        "ticker_lateness_ms_max": round(max(lateness) * 1000, 2) if lateness else None,
+    }
+
+
+def filtered_call_ns(iterations):
+    """Cost of a debug call filtered out at INFO: f-string vs lazy arguments"""
+    logger = server.logger
+    username, count = "player7", 12
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        logger.debug(f"{username} buzzed in, queue length {count}")
+    eager = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        logger.debug("%s buzzed in, queue length %s", username, count)
+    lazy = time.perf_counter() - start
+    return {"f_string_ns": round(eager / iterations * 1e9), "lazy_ns": round(lazy / iterations * 1e9)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--slow-ms", type=float, nargs="+", default=[0, 1])
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for slow_ms in args.slow_ms:
+            for mode, configure in (("sync", configure_sync), ("queue", configure_queue)):
+                close = configure(directory, slow_ms / 1000)
+                handler = logging.getLogger().handlers[0]
+                blocked, lateness = asyncio.run(burst(args.calls))
+                result = {"mode": mode, "slow_ms": slow_ms, **summarize(blocked, lateness)}
+                if isinstance(handler, server.LogQueueHandler):
+                    result["dropped"] = handler.dropped
+                results.append(result)
+                close()
+        filtered = filtered_call_ns(200000)
+
+    print(json.dumps({"calls": args.calls, "results": results, "filtered_debug_call": filtered}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Compare the token-bucket rate limiter with the old timestamp-list limiter.
+
+The old check_rate_limit kept a list of message timestamps per client and
+rebuilt it (scanning up to RATE_LIMIT_MAX_MESSAGES floats) on every message.
+The token bucket does a fixed amount of arithmetic per message. For each
+scenario the script reports nanoseconds per check for both limiters, how many
+messages each accepted, and the per-client memory of the limiter state.
+
+    python benchmarks/rate_limiter.py --checks 200000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def legacy_check_rate_limit(client_data, now, window, max_messages):
+    """The previous implementation, with the clock passed in"""
+    client_data['message_timestamps'] = [
+        ts for ts in client_data['message_timestamps']
+        if now - ts < window
+    ]
+    if len(client_data['message_timestamps']) >= max_messages:
+        return False
+    client_data['message_timestamps'].append(now)
+    return True
+
+
+def token_bucket_check(bucket, now):
+    return bucket.take(now)
+
+
+def run_legacy(times, window, max_messages):
+    client_data = {'message_timestamps': []}
+    start = time.perf_counter()
+    accepted = sum(legacy_check_rate_limit(client_data, now, window, max_messages) for now in times)
+    return time.perf_counter() - start, accepted
+
+
+def run_bucket(times, window, max_messages):
+    bucket = server.TokenBucket(max_messages, window)
+    bucket.updated = times[0]
+    start = time.perf_counter()
+    accepted = sum(token_bucket_check(bucket, now) for now in times)
+    return time.perf_counter() - start, accepted
+
+
+def limiter_memory(make, clients=1000):
+    """Bytes per client for a populated limiter"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    states = [make() for _ in range(clients)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del states
+    return total // clients
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checks", type=int, default=200000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    window = server.RATE_LIMIT_WINDOW
+    max_messages = server.RATE_LIMIT_MAX_MESSAGES
+    # Message arrival patterns, as offsets in seconds from the first message
+    scenarios = {
+        # A steady client just under the limit keeps a nearly full timestamp list
+        "steady_at_limit": [i * window / max_messages * 1.01 for i in range(args.checks)],
+        # A flooding client: everything past the first burst is rejected
+        "flood": [i * 0.0001 for i in range(args.checks)],
+        # A quiet client: the list stays short
+        "quiet": [i * 5.0 for i in range(args.checks)],
+    }
+
+    results = []
+    for name, offsets in scenarios.items():
+        times = [1000.0 + offset for offset in offsets]
+        legacy_time, legacy_accepted = run_legacy(times, window, max_messages)
+        bucket_time, bucket_accepted = run_bucket(times, window, max_messages)
+        results.append({
+            "scenario": name,
+            "legacy_ns_per_check": round(legacy_time / len(times) * 1e9),
+            "token_bucket_ns_per_check": round(bucket_time / len(times) * 1e9),
+            "speedup": round(legacy_time / bucket_time, 1),
+            "legacy_accepted": legacy_accepted,
+            "token_bucket_accepted": bucket_accepted,
+        })
+
+    def full_legacy_state():
+        return {'message_timestamps': [1000.0 + i for i in range(max_messages)]}
+
+    def bucket_state():
+        return server.TokenBucket(max_messages, window)
+
+    print(json.dumps({
+        "checks": args.checks,
+        "limit": f"{max_messages} per {window}s",
+        "results": results,
+        "bytes_per_client": {
+            "legacy_full_window": limiter_memory(full_legacy_state),
+            "token_bucket": limiter_memory(bucket_state),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Compare game-state traffic of full snapshots against the delta protocol.
+
+Connects a host and N players (half on each protocol), plays a scripted
+sequence of buzzes, boots, wins and score updates with the scoreboard on,
+and reports the bytes each kind of player received per event. Delta
+players rebuild state from the ops they receive; the result is checked
+against a fresh snapshot at the end.
+
+    python benchmarks/state_traffic.py --players 40 --rounds 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websockets  # noqa: E402
+import server  # noqa: E402
+
+
+def apply_ops(state, ops):
+    """Client-side reference implementation of the delta ops"""
+    state["win_player"] = None
+    for op in ops:
+        name, args = op[0], op[1:]
+        if name == "queue_append":
+            state["queue"].append(args[0])
+        elif name == "queue_remove":
+            state["queue"].remove(args[0])
+        elif name == "queue_clear":
+            state["queue"] = []
+        elif name == "lock":
+            state["buzz_lock"] = args[0]
+        elif name == "join":
+            state["connected_players"].append(args[0])
+        elif name == "leave":
+            state["connected_players"].remove(args[0])
+        elif name == "score":
+            scores = state.setdefault("scores", {})
+            scores[args[0]] = scores.get(args[0], 0) + args[1]
+        elif name == "scores":
+            state["scores"] = dict(args[0])
+        elif name == "scoreboard":
+            state["scoreboard_enabled"] = args[0]
+            if not args[0]:
+                state.pop("scores", None)
+        elif name == "win":
+            state["win_player"] = args[0]
+
+
+class Player:
+    def __init__(self, websocket, delta):
+        self.websocket = websocket
+        self.delta = delta
+        self.bytes = 0
+        self.frames = 0
+        self.state = None
+        self.gaps = 0
+
+    async def read(self):
+        try:
+            async for message in self.websocket:
+                if not message.startswith("{"):
+                    continue
+                self.bytes += len(message)
+                self.frames += 1
+                data = json.loads(message)
+                if data.get("type") == "delta":
+                    if self.state is None or data["base"] != self.state["version"]:
+                        self.gaps += 1
+                        await self.websocket.send("SNAPSHOT")
+                        continue
+                    apply_ops(self.state, data["ops"])
+                    self.state["version"] = data["version"]
+                elif "queue" in data:
+                    self.state = data
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def run(args):
+    logging.getLogger().setLevel(logging.WARNING)
+    server.MAX_CLIENTS = args.players + 1
+    server.RATE_LIMIT_MAX_MESSAGES = 10 ** 6
+    server.RATE_LIMIT_MAX_BUZZ = 10 ** 6
+
+    ws_server = await websockets.serve(server.handle_client, "127.0.0.1", 0)
+    port = ws_server.sockets[0].getsockname()[1]
+    url = f"ws://127.0.0.1:{port}"
+
+    host = await websockets.connect(url)
+    await host.send(f"host:{server.host_password}")
+    players = []
+    for i in range(args.players):
+        websocket = await websockets.connect(url)
+        await websocket.send(f"player{i}")
+        delta = i % 2 == 0
+        if delta:
+            await websocket.send("FEATURES:delta")
+        players.append(Player(websocket, delta))
+    readers = [asyncio.create_task(player.read()) for player in players]
+    host_reader = asyncio.create_task(drain(host))
+    await host.send("TOGGLE_SCOREBOARD:ON")
+    await asyncio.sleep(0.5)
+    for player in players:
+        player.bytes = player.frames = 0
+
+    events = 0
+    for _ in range(args.rounds):
+        await host.send("UNLOCK")
+        for player in players[:args.buzzers]:
+            await player.websocket.send("BUZZ")
+        await host.send("BOOT")
+        await host.send("SCORE_UPDATE:player0:-200")
+        await host.send("WIN")
+        await host.send("SCORE_UPDATE:player1:400")
+        events += 5 + args.buzzers
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.5)
+
+    reference = json.loads(server.rooms[server.DEFAULT_ROOM].build_snapshot())
+    result = {"players": args.players, "events": events}
+    for delta in (False, True):
+        group = [player for player in players if player.delta == delta]
+        key = "delta" if delta else "snapshot"
+        result[f"{key}_bytes_per_event_per_player"] = round(sum(p.bytes for p in group) / len(group) / events, 1)
+        if delta:
+            result["delta_gaps"] = sum(p.gaps for p in group)
+            result["delta_state_matches"] = all(
+                {k: v for k, v in p.state.items() if k != "win_player"} ==
+                {k: v for k, v in reference.items() if k != "win_player"}
+                for p in group
+            )
+    print(json.dumps(result, indent=2))
+
+    for task in readers + [host_reader]:
+        task.cancel()
+    for player in players:
+        player.websocket.transport.abort()
+    host.transport.abort()
+    ws_server.close()
+
+
+async def drain(websocket):
+    try:
+        async for _ in websocket:
+            pass
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--buzzers", type=int, default=5, help="players buzzing each round")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
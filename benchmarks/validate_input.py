@@ -0,0 +1,128 @@
+"""Fuzz validate_input against the old implementation, then time both.
+
+The fuzzer builds random strings from characters that exercise every branch
+of the old sanitizer (all control characters, every Unicode whitespace
+character, zero-width and non-printable characters, plain text) at lengths
+around the limit, and checks that both implementations return the same text
+or raise the same error. It also checks that clean input is returned without
+a copy. The benchmark then times typical and hostile inputs.
+
+    python benchmarks/validate_input.py --cases 200000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+
+
+def legacy_validate_input(text, max_length, field_name):
+    """validate_input as it was before the fast path"""
+    if not isinstance(text, str):
+        raise ValueError(f"{field_name} must be a string")
+
+    sanitized = ''.join(char for char in text if ord(char) >= 32 or char in '\n\r\t')
+    sanitized = ' '.join(sanitized.split())
+
+    if len(sanitized) > max_length:
+        raise ValueError(f"{field_name} exceeds maximum length of {max_length}")
+
+    if not sanitized.strip():
+        raise ValueError(f"{field_name} cannot be empty")
+
+    return sanitized.strip()
+
+
+WHITESPACE = [chr(code) for code in range(0x3001) if chr(code).isspace()]
+CONTROL = [chr(code) for code in range(32)] + ['\x7f', '\x85']
+ODD = ['\u200b', '\u200d', '\ufeff', '\xad', '\ue000', '\U0001f600', '\u0301', '\u2066']
+TEXT = list("abcXYZ019$-_.'é漢")
+ALPHABETS = [
+    TEXT,
+    TEXT + [' '],
+    TEXT + [' '] * 4 + WHITESPACE,
+    TEXT + CONTROL,
+    TEXT + [' '] * 4 + WHITESPACE + CONTROL + ODD,
+    WHITESPACE + CONTROL,
+    [' '] + CONTROL[:3],
+]
+
+
+def outcome(function, text, max_length):
+    try:
+        return ("ok", function(text, max_length, "Field"))
+    except ValueError as e:
+        return ("error", str(e))
+
+
+def fuzz(cases, seed):
+    rng = random.Random(seed)
+    failures = []
+    for _ in range(cases):
+        alphabet = rng.choice(ALPHABETS)
+        max_length = rng.choice([0, 1, 5, 50, 500])
+        length = rng.choice([0, 1, 2, max_length, max_length + 1, 2 * max_length + 3, rng.randint(0, 3 * max_length + 10)])
+        text = ''.join(rng.choice(alphabet) for _ in range(length))
+        expected = outcome(legacy_validate_input, text, max_length)
+        actual = outcome(server.validate_input, text, max_length)
+        if expected != actual:
+            failures.append({"text": text, "max_length": max_length, "expected": expected, "actual": actual})
+
+    for value in [None, 42, b"bytes", ["list"]]:
+        if outcome(legacy_validate_input, value, 10) != outcome(server.validate_input, value, 10):
+            failures.append({"text": repr(value), "max_length": 10})
+
+    # Clean input comes back as the same object
+    for text in ["alice", "Final answer text", "漢字 ok", "x" * 500]:
+        if server.validate_input(text, 500, "Field") is not text:
+            failures.append({"text": text, "copied": True})
+    return failures
+
+
+def per_call_us(function, text, max_length, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            function(text, max_length, "Field")
+        except ValueError:
+            pass
+    return round((time.perf_counter() - start) / iterations * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    failures = fuzz(args.cases, args.seed)
+
+    big = server.MAX_MESSAGE_LENGTH
+    inputs = {
+        "clean_username": ("player_one", server.MAX_USERNAME_LENGTH, 100000),
+        "messy_username": ("  player\tone\x00 ", server.MAX_USERNAME_LENGTH, 100000),
+        "final_answer": ("What is the Treaty of Westphalia? " * 10, server.MAX_FINAL_ANSWER_LENGTH, 20000),
+        "hostile_text_500kb": ("a" * big, server.MAX_FINAL_ANSWER_LENGTH, 20),
+        "hostile_spaces_500kb": (" " * big, server.MAX_FINAL_ANSWER_LENGTH, 20),
+        "hostile_control_500kb": ("\x00" * big, server.MAX_FINAL_ANSWER_LENGTH, 20),
+    }
+    timings = []
+    for name, (text, max_length, iterations) in inputs.items():
+        legacy = per_call_us(legacy_validate_input, text, max_length, iterations)
+        fast = per_call_us(server.validate_input, text, max_length, iterations)
+        timings.append({"input": name, "legacy_us": legacy, "fast_us": fast, "speedup": round(legacy / fast, 1)})
+
+    print(json.dumps({"fuzz_cases": args.cases, "mismatches": len(failures), "examples": failures[:5],
+                      "timings": timings}, indent=2, ensure_ascii=False))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
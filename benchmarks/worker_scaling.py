@@ -0,0 +1,178 @@
+"""Measure throughput of the server with 1..N worker processes.
+
+For each worker count the script starts server.py (plain for 1 worker,
+router plus workers otherwise) with rate limits lifted, then runs
+load-generator processes that each drive a share of the rooms. In every
+room a host unlocks the buzzer, all players buzz as soon as they see it
+unlocked, and the host locks again once the queue is full. Reported are
+completed buzz rounds and state frames delivered per second.
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 --rooms 32 --players 10 --duration 10
+
+Scaling needs as many free cores as workers plus generators; on a machine
+with fewer cores the numbers stay flat.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "benchmark"
+
+LAUNCHER = """
+import asyncio, sys
+sys.path.insert(0, {root!r})
+import server
+server.RATE_LIMIT_MAX_MESSAGES = 10 ** 9
+server.RATE_LIMIT_MAX_BUZZ = 10 ** 9
+server.RATE_LIMIT_MAX_HOST = 10 ** 9
+server.WORKER_BASE_PORT = {worker_base}
+if {workers} > 1:
+    asyncio.run(server.run_router(port={port}, workers={workers}))
+else:
+    asyncio.run(server.main(port={port}))
+"""
+
+
+async def play_room(url, players_count, deadline, counters):
+    import websockets
+
+    host = await websockets.connect(url)
+    await host.send(f"host:{PASSWORD}")
+    players = []
+    for i in range(players_count):
+        websocket = await websockets.connect(url)
+        await websocket.send(f"player{i}")
+        players.append(websocket)
+
+    async def player_loop(websocket):
+        buzzed = False
+        async for message in websocket:
+            if not message.startswith("{"):
+                continue
+            state = json.loads(message)
+            if "queue" not in state:  # session, error and other non-state frames
+                continue
+            counters["frames"] += 1
+            if state["buzz_lock"] and not buzzed:
+                buzzed = True
+                await websocket.send("BUZZ")
+            elif not state["buzz_lock"]:
+                buzzed = False
+
+    tasks = [asyncio.create_task(player_loop(websocket)) for websocket in players]
+    await asyncio.sleep(0.5)
+    await host.send("UNLOCK")
+    locking = False
+    async for message in host:
+        if not message.startswith("{"):
+            continue
+        state = json.loads(message)
+        if "queue" not in state:
+            continue
+        counters["frames"] += 1
+        if not locking and len(state["queue"]) == players_count:
+            locking = True
+            await host.send("LOCK")
+        elif locking and not state["buzz_lock"]:
+            counters["rounds"] += 1
+            locking = False
+            if time.monotonic() >= deadline:
+                break
+            await host.send("UNLOCK")
+
+    for task in tasks:
+        task.cancel()
+    for websocket in players + [host]:
+        websocket.transport.abort()
+
+
+def generator(url_base, rooms, players_count, duration, results):
+    counters = {"frames": 0, "rounds": 0}
+
+    async def run():
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(play_room(f"{url_base}/{room}", players_count, deadline, counters) for room in rooms))
+
+    asyncio.run(run())
+    results.put(counters)
+
+
+def wait_for_port(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not open port {port}")
+
+
+def measure(workers, args):
+    code = LAUNCHER.format(root=ROOT, workers=workers, port=args.port, worker_base=args.port + 1)
+    env = dict(os.environ, HOST_PASSWORD=PASSWORD)
+    with tempfile.TemporaryDirectory() as workdir:
+        server = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.port)
+            if workers > 1:
+                for index in range(workers):
+                    wait_for_port(args.port + 1 + index)
+            rooms = [f"bench{index}" for index in range(args.rooms)]
+            results = multiprocessing.Queue()
+            generators = [
+                multiprocessing.Process(target=generator, args=(
+                    f"ws://127.0.0.1:{args.port}", rooms[index::args.generators],
+                    args.players, args.duration, results))
+                for index in range(args.generators)
+            ]
+            start = time.monotonic()
+            for process in generators:
+                process.start()
+            totals = {"frames": 0, "rounds": 0}
+            for _ in generators:
+                for key, value in results.get().items():
+                    totals[key] += value
+            elapsed = time.monotonic() - start
+            for process in generators:
+                process.join()
+        finally:
+            server.terminate()
+            server.wait()
+    return {
+        "workers": workers,
+        "rounds_per_s": round(totals["rounds"] / elapsed, 1),
+        "frames_per_s": round(totals["frames"] / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rooms", type=int, default=32)
+    parser.add_argument("--players", type=int, default=10, help="players per room")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--generators", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="load-generator processes")
+    parser.add_argument("--port", type=int, default=9990)
+    args = parser.parse_args()
+
+    results = [measure(workers, args) for workers in args.workers]
+    baseline = results[0]["frames_per_s"] or 1
+    for result in results:
+        result["speedup"] = round(result["frames_per_s"] / baseline, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "rooms": args.rooms, "players": args.players,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
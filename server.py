@@ -1,534 +1,3097 @@
 import asyncio
 import websockets
 import json
+import marshal
+import math
+import mimetypes
 import time
 import logging
+import logging.handlers
+import queue
+import atexit
 import uuid
 import os
-from typing import Set, Dict, Optional
+import re
+import secrets
+import signal
+import hashlib
+import hmac
+import base64
+import dataclasses
+import struct
+import argparse
+import multiprocessing
+import sys
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque, OrderedDict
+from http import HTTPStatus
+from urllib.parse import parse_qs
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import Opcode
+
+# Logging configuration: records are queued by the event loop and written by a
+# background thread, so file and terminal I/O never blocks game traffic
+LOG_FILE = 'jeopardy_server.log'  # JSON lines, one record per line
+LOG_LEVEL = logging.INFO
+LOG_MAX_BYTES = 10_000_000  # rotate the log file at this size
+LOG_BACKUP_COUNT = 5        # rotated files kept (jeopardy_server.log.1 ...)
+LOG_QUEUE_SIZE = 10000      # records waiting for the writer thread
+LOG_BLOCK_TIMEOUT = 0.05    # seconds a warning or error may wait for queue space before it is dropped
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format each record as one JSON object"""
+    
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to the writer thread without waiting for I/O
+    
+    Records are formatted by the writer thread, so log calls pass their
+    values as arguments ("%s", value) rather than pre-formatted strings.
+    When the writer falls behind and the queue is full, debug and info
+    records are dropped; warnings and errors wait up to LOG_BLOCK_TIMEOUT.
+    Drops are counted and reported once the queue has room again.
+    """
+    
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record):
+        return record
+    
+    def enqueue(self, record):
+        if self.dropped:
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": record.name, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Dropped %s log records while the log writer was behind", "args": (self.dropped,),
+                }))
+                self.dropped = 0
+            except queue.Full:
+                pass
+        
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=LOG_BLOCK_TIMEOUT)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+
+log_listener: Optional[logging.handlers.QueueListener] = None
+
+def stop_logging():
+    """Write out queued records and stop the writer thread"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+def configure_logging(log_file=LOG_FILE):
+    """Route all logging through a queue to a writer thread, replacing any earlier setup"""
+    global log_listener
+    stop_logging()
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(LogQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    log_listener.start()
 
 # Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('jeopardy_server.log'),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
+atexit.register(stop_logging)
 logger = logging.getLogger(__name__)
 
-# Game state
-buzz_lock = False
-buzz_queue = []
-host_socket = None
-clients: Set[websockets.WebSocketServerProtocol] = set()
-client_info: Dict[websockets.WebSocketServerProtocol, Dict] = {}
-drawing_mode = False
-currently_drawing = []  # Track who is currently drawing
+# Connections and game rooms. Each room is a separate game, chosen by the
+# connection path (ws://server:9999/<room-code>); the bare path joins DEFAULT_ROOM.
+client_info: Dict[websockets.WebSocketServerProtocol, 'ClientState'] = {}
+rooms: Dict[str, 'GameRoom'] = {}
+
+# Host authentication
+host_password = os.environ.get('HOST_PASSWORD', str(uuid.uuid4()))
+logger.info("Host password: %s", host_password)
+
+# Optional protocol features, enabled per client with FEATURES:<a,b>:
+# - delta: {"type": "delta", "base", "version", "ops"} frames instead of full
+#   snapshots; the client sends SNAPSHOT when it sees a gap
+# - blobs: drawings arrive as small DRAWING_REF frames; the client sends
+#   DRAWING_FETCH:<hash> for the images it actually shows
+# - binary: drawings submitted as binary frames are relayed to the client
+#   unchanged, and DRAWING_FETCH and MEDIA_FETCH answer with binary
+#   DRAWING_DATA and MEDIA_DATA frames
+# - compact: PONG, PENALTY and (with delta) state deltas arrive as binary
+#   frames, see BINARY_* below
+SUPPORTED_FEATURES = {'delta', 'blobs', 'binary', 'compact'}
+
+# Heartbeat configuration
+HEARTBEAT_INTERVAL = 30  # seconds between room reaping and outbox reports
+HEARTBEAT_TIMEOUT = 90   # seconds - Increased to be more tolerant of inactive tabs
+HEARTBEAT_TICK = 1.0     # seconds, resolution of the heartbeat timer wheel
+# Transport keepalive (websockets ping/pong) closes dead TCP connections on its
+# own; the heartbeat only has to catch clients that stay connected but silent
+KEEPALIVE_INTERVAL = 20  # seconds between pings
+KEEPALIVE_TIMEOUT = 10   # seconds to wait for a pong
+
+# Rate limiting configuration: each limit is a token bucket holding up to MAX
+# messages that refills at MAX per WINDOW, so bursts up to MAX are allowed
+RATE_LIMIT_WINDOW = 60   # seconds
+RATE_LIMIT_MAX_MESSAGES = 100  # messages per window
+RATE_LIMIT_BUZZ_WINDOW = 5   # seconds  
+RATE_LIMIT_MAX_BUZZ = 3      # buzz attempts per window
+RATE_LIMIT_DRAWING_WINDOW = 10  # seconds
+RATE_LIMIT_MAX_DRAWINGS = 3     # drawing submissions per window
+RATE_LIMIT_STROKE_WINDOW = 1  # seconds
+RATE_LIMIT_MAX_STROKES = 30   # STROKES batches per window (not counted against the general limit)
+RATE_LIMIT_HOST_WINDOW = 60   # seconds
+RATE_LIMIT_MAX_HOST = 600     # host messages per window (the host is not held to the general limit)
+
+# Security configuration
+MAX_USERNAME_LENGTH = 50
+MAX_MESSAGE_LENGTH = 500000  # Increased to accommodate drawing submissions
+MAX_CLIENTS = 50  # per room
+MAX_FINAL_ANSWER_LENGTH = 500
+MAX_WAGER_LENGTH = 50
+MAX_DRAWING_SIZE = 500000  # 500KB limit for drawing data
+MAX_THUMBNAIL_SIZE = 8000  # optional client-made preview sent inline with drawing references
+DRAWING_STORE_MAX_BYTES = 64_000_000  # drawings kept for DRAWING_FETCH, least recently used evicted first
+
+# Live drawing configuration (DRAWING_MODE:LIVE)
+STROKE_TICK = 0.05            # seconds between combined stroke updates to the host
+MAX_STROKES_MESSAGE = 32000   # characters in one STROKES batch
+MAX_STROKE_POINTS = 50000     # points kept per player per round
+MAX_STROKE_COLOR_LENGTH = 32
+
+# Binary frames: the first byte is the frame type
+# Drawing submissions: [type:u8][username length:u8][timestamp ms:f64][username][payload]
+BINARY_HEADER = struct.Struct('!BBd')
+BINARY_DRAWING_SUBMIT = 0x01  # payload: raw PNG/JPEG/WebP bytes
+BINARY_DRAWING_DATA = 0x02    # server -> client, [type][32-byte SHA-256][raw image bytes]
+BINARY_MEDIA_DATA = 0x03      # server -> client, [type][media id:u32][raw media bytes]
+MEDIA_HEADER = struct.Struct('!BI')
+# Compact commands (FEATURES:compact) are single-byte frames
+BINARY_BUZZ = 0x10
+BINARY_PING = 0x11
+BINARY_PONG = 0x12            # server -> client
+BINARY_PENALTY = 0x13         # server -> client
+BINARY_STATE_DELTA = 0x20     # server -> client, [type][base:u32][version:u32][op count:u16][ops]
+BINARY_SPECTATOR_STATE = 0x21 # server -> spectator, [type][zlib-compressed game-state JSON]
+COMPACT_DELTA_HEADER = struct.Struct('!BIIH')
+COMPACT_COMMANDS = {BINARY_BUZZ: "BUZZ", BINARY_PING: "PING"}
+COMPACT_PONG = bytes((BINARY_PONG,))
+COMPACT_PENALTY = bytes((BINARY_PENALTY,))
+# Delta op codes; each op's arguments follow in order: names as u8 length + UTF-8,
+# booleans as u8, numbers as i64, and score maps as u16 count + (name, i64) pairs
+I64_RANGE = range(-2**63, 2**63)  # numbers that fit an i64 argument (scores and score changes)
+COMPACT_OPS = {
+    name: code for code, name in enumerate((
+        "queue_append", "queue_remove", "queue_clear", "lock", "join",
+        "leave", "score", "scores", "scoreboard", "win",
+    ))
+}
+
+# Game journal: every state-changing command is appended to a binary journal
+# in JOURNAL_DIR, so a restarted server picks up each room's scores and buzzer
+# state where it left off. A snapshot of every room is saved each
+# JOURNAL_SNAPSHOT_EVERY events and the journal before it deleted, so recovery
+# reads one snapshot and at most that many events however long the game ran.
+JOURNAL_DIR = 'journal'          # '' disables the journal; workers use JOURNAL_DIR/worker<N>
+JOURNAL_SNAPSHOT_EVERY = 5000    # events between snapshots
+# Records: [payload length:u32][CRC-32 of sequence and payload:u32][sequence:u64][payload]
+JOURNAL_RECORD = struct.Struct('!IIQ')
+# Payloads: [event code:u8][room code][arguments], encoded like delta op
+# arguments. Each event lists its argument types: s name, b boolean, q number.
+JOURNAL_EVENTS = {
+    "player": "s",        # a new player joined, with a score of 0
+    "buzz": "s",
+    "boot": "",
+    "win": "",
+    "lock": "",
+    "unlock": "",
+    "leave_queue": "s",   # a queued player disconnected
+    "score": "sq",        # player, change
+    "scoreboard": "b",
+    "drawing_mode": "s",  # ON, LIVE or OFF
+    "reset": "",
+    "close": "",
+}
+JOURNAL_EVENT_CODES = {name: code for code, name in enumerate(JOURNAL_EVENTS)}
+JOURNAL_EVENT_NAMES = list(JOURNAL_EVENTS)
+
+# Broadcast configuration
+SEND_TIMEOUT = 5.0  # seconds a client may take to accept a frame before it is detached
+OUTBOX_MAX_FRAMES = 256       # queued frames per client before it is detached
+OUTBOX_MAX_BYTES = 32_000_000 # queued bytes per client (a full drawing round) before it is detached;
+                              # frames are shared between outboxes, so this is not per-client memory
+OUTBOX_WARN_FRAMES = 32       # queue depth reported as backed up by the heartbeat monitor
+BROADCAST_WINDOW = 0.005      # seconds of state changes collected into one update (0 sends each change at once)
+
+# Spectators (ws://server:9999/<room>?spectate): read-only viewers that skip the
+# username handshake and share one pre-encoded game-state frame per update
+MAX_SPECTATORS = 5000            # per room, not counted against MAX_CLIENTS
+SPECTATOR_UPDATE_INTERVAL = 0.5  # seconds; spectators get at most one update per interval
+SPECTATOR_COMPRESSION_LEVEL = 6  # zlib level for ?spectate=zlib frames
+
+# Compression (permessage-deflate). Each distinct frame is compressed once and
+# the result shared by every socket that sends it; binary frames are never compressed.
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 1024          # text frames smaller than this (most state JSON) go out uncompressed
+COMPRESSION_LEVEL = 6
+COMPRESSION_WINDOW_BITS = 12         # LZ77 window, both directions
+COMPRESSION_MEM_LEVEL = 5
+COMPRESSION_CACHE_BYTES = 16_000_000 # compressed frames kept for reuse, least recently used evicted first
+
+# Room configuration
+DEFAULT_ROOM = 'main'
+MAX_ROOMS = 500
+ROOM_IDLE_TIMEOUT = 1800  # seconds an empty room keeps its scores before it is reclaimed
+ROOM_CODE_PATTERN = re.compile(r'^[a-z0-9_-]{1,32}$')
+
+# Final Jeopardy: wagers and answers are kept in the room and reach the host
+# together when their phase closes, at the deadline or once every player has sent one
+FINAL_WAGER_SECONDS = 60
+FINAL_ANSWER_SECONDS = 45
+
+# Game packs (LOAD_PACK:<name>): boards read from PACK_DIR/<name>.json, with
+# media files under PACK_DIR/<name>/. A pack is compiled once into
+# PACK_CACHE_DIR, keyed by its SHA-256, and later loads read the compiled board.
+PACK_DIR = 'packs'
+PACK_CACHE_DIR = os.path.join('packs', '.compiled')  # '' disables the compiled cache
+PACK_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+PACK_FORMAT_VERSION = 1          # of the compiled board; older compiled files are rebuilt
+MAX_PACK_BYTES = 50_000_000
+MAX_PACK_TEXT_LENGTH = 2000      # characters in a title, name, clue or answer
+LOADED_PACKS_MAX = 16            # compiled packs kept in memory for rooms that load them again
+MAX_MEDIA_BYTES = 5_000_000      # per media file
+MEDIA_CACHE_BYTES = 64_000_000   # media frames kept for MEDIA_FETCH, least recently used evicted first
+
+# Session resumption: every client is sent a token it can later present
+# instead of a username (RESUME:<token>:<version>) to take its place back
+SESSION_RESUME_WINDOW = 30  # seconds a dropped player keeps their buzz-queue place
+SESSION_TOKEN_BYTES = 24
+DELTA_HISTORY = 64          # recent delta batches kept per room to catch resuming clients up
+PRESENCE_DEBOUNCE = 0.5     # seconds joins and leaves wait, so a reconnect storm goes out as one update
+
+# Worker mode configuration (--workers N): a router process accepts every
+# connection and forwards it to the worker that owns the room
+WORKER_BASE_PORT = 10000      # workers listen on 127.0.0.1:WORKER_BASE_PORT + index
+WORKER_RESTART_DELAY = 1.0    # seconds before restarting a crashed worker, doubled per repeated crash
+WORKER_MAX_RESTART_DELAY = 30.0
+WORKER_STABLE_AFTER = 60      # seconds a worker must stay up to reset its crash count
+WORKER_STOP_TIMEOUT = 5.0     # seconds a stopping router waits for each worker before killing it
+WORKER_PARENT_POLL = 1.0      # seconds between a worker's checks that its router is still running
+TRUST_FORWARDED_FOR = False   # set in workers, which only accept connections from the router
+
+# Metrics and profiling, served over HTTP on the game port (the room codes
+# "metrics" and "profile" are therefore unreachable)
+METRICS_PATH = '/metrics'     # Prometheus text format
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # if set, scrapes need "Authorization: Bearer <token>"
+METRIC_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)  # seconds
+LOOP_LAG_INTERVAL = 0.5       # seconds between event-loop lag probes
+PROFILE_PATH = '/profile'     # GET /profile?start, /profile?stop (returns the stacks), /profile (status); "Authorization: Bearer <host password>"
+PROFILE_INTERVAL = 0.005      # seconds between stack samples while profiling
+PROFILE_MAX_SECONDS = 300
+
+# Marks the queue slot of the pending game-state snapshot in an Outbox
+_SNAPSHOT = object()
+
+class TokenBucket:
+    """Rate limiter allowing bursts of capacity messages, refilled at rate per second"""
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+    
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def take(self, now) -> bool:
+        """Spend one token if there is one"""
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+class ClientState:
+    """Everything the server tracks for one connection"""
+    __slots__ = ('username', 'last_heartbeat', 'is_host', 'features', 'room', 'outbox', 'writer', 'buckets', 'session')
+    
+    def __init__(self, room, outbox, writer):
+        self.username = None
+        self.last_heartbeat = time.monotonic()
+        self.is_host = False
+        self.features = set()
+        self.room = room
+        self.outbox = outbox
+        self.writer = writer
+        self.buckets: Dict[str, TokenBucket] = {}  # created on first use, see check_rate_limit
+        self.session: Optional[ClientSession] = None
+
+class ClientSession:
+    """A client's identity, kept so a new connection can take it over
+    
+    Lives as long as the connection, then SESSION_RESUME_WINDOW more once it
+    drops; while it is held the player keeps their place in the buzz queue.
+    """
+    __slots__ = ('token', 'username', 'is_host', 'features', 'buckets', 'websocket', 'expiry')
+    
+    def __init__(self, username, is_host, websocket):
+        self.token = secrets.token_urlsafe(SESSION_TOKEN_BYTES)
+        self.username = username
+        self.is_host = is_host
+        self.features = set()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.websocket = websocket  # None while held
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+class TimerWheel:
+    """Deadlines hashed into slots of `resolution` seconds
+    
+    Only slots that have come due are visited, so expiry work grows with the
+    number of deadlines reached rather than with the number scheduled.
+    """
+    
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self.slots: Dict[int, Dict] = {}
+        self.cursor = int(time.monotonic() // resolution)  # first slot not yet visited
+    
+    def schedule(self, key, deadline):
+        """Add key to the slot covering deadline (a time.monotonic() value)"""
+        tick = max(int(-(-deadline // self.resolution)), self.cursor)
+        self.slots.setdefault(tick, {})[key] = None
+    
+    def due(self, now) -> list:
+        """Remove and return the keys of every slot up to now"""
+        keys = []
+        tick = int(now // self.resolution)
+        while self.cursor <= tick:
+            slot = self.slots.pop(self.cursor, None)
+            if slot:
+                keys.extend(slot)
+            self.cursor += 1
+        return keys
+
+class Outbox:
+    """Bounded outbound queue for one connection, drained by its writer task
+    
+    Game-state snapshots are coalesced: a new snapshot replaces any snapshot
+    still waiting, so a slow client only ever receives the latest state.
+    Every other frame (FINAL, RESET_GAME, DRAWING_SUBMIT, ...) is kept and
+    delivered in order.
+    """
+    
+    def __init__(self):
+        self.frames = deque()
+        self.snapshot = None
+        self.size = 0
+        self.ready = asyncio.Event()
+        self.detached = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+    
+    def depth(self) -> int:
+        return len(self.frames)
+    
+    def put(self, frame, snapshot=False) -> bool:
+        """Queue a frame; returns False (and counts a drop) if the outbox is full"""
+        if snapshot and self.snapshot is not None:
+            # Latest state wins: the stale snapshot gives up its slot
+            self.frames.remove(_SNAPSHOT)
+            self.size -= len(self.snapshot)
+            self.snapshot = None
+            self.coalesced += 1
+        
+        if self.detached or len(self.frames) >= OUTBOX_MAX_FRAMES or self.size + len(frame) > OUTBOX_MAX_BYTES:
+            self.dropped += 1
+            return False
+        
+        if snapshot:
+            self.snapshot = frame
+            self.frames.append(_SNAPSHOT)
+        else:
+            self.frames.append(frame)
+        self.size += len(frame)
+        self.ready.set()
+        return True
+    
+    async def get(self):
+        """Wait for and return the next frame to send"""
+        while not self.frames:
+            self.ready.clear()
+            await self.ready.wait()
+        
+        frame = self.frames.popleft()
+        if frame is _SNAPSHOT:
+            frame, self.snapshot = self.snapshot, None
+        self.size -= len(frame)
+        return frame
+
+class SpectatorFeed:
+    """A room's latest spectator frame in one format, shared by every spectator
+    
+    Spectators have no outbox: each one's writer sends the newest frame once
+    its socket is free, so a slow spectator skips updates rather than queueing.
+    """
+    
+    def __init__(self):
+        self.frame = None
+        self.version = 0
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+    
+    def publish(self, frame):
+        self.frame = frame
+        self.version += 1
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+class FinalRound:
+    """Final Jeopardy wagers and answers, by player, for one round
+    
+    phase is 'wagers' or 'answers' while collecting, then 'judging' once the
+    answers have gone to the host. delivered is the latest combined frame
+    sent to the host, sent again if the host reconnects.
+    """
+    __slots__ = ('phase', 'wagers', 'answers', 'deadline', 'delivered')
+    
+    def __init__(self):
+        self.phase = None
+        self.wagers: Dict[str, str] = {}
+        self.answers: Dict[str, str] = {}
+        self.deadline: Optional[asyncio.TimerHandle] = None
+        self.delivered: Optional[str] = None
+
+class BlobStore:
+    """Size-bounded LRU store of ready-to-send frames
+    
+    Drawings are keyed by (image hash, binary) so each image is kept once per
+    wire format, and repeated fetches (from any room) reuse the same frame
+    without re-encoding. Compressed frames are keyed by (window bits, hash).
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def put(self, key, frame):
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return
+        
+        self.frames[key] = frame
+        self.size += len(frame)
+        while self.size > self.max_bytes and len(self.frames) > 1:
+            _, evicted = self.frames.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+    
+    def get(self, key):
+        """The frame stored under key, or None if unknown or evicted"""
+        frame = self.frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return frame
+
+class MetricCounter:
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0
+
+class Histogram:
+    """Observations counted into METRIC_BUCKETS"""
+    __slots__ = ('counts', 'sum')
+    
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect_left(METRIC_BUCKETS, value)] += 1
+        self.sum += value
+
+class Metrics:
+    """Counters and histograms, rendered in the Prometheus text format
+    
+    Hot paths look up their metric once (get) and keep it, so recording is an
+    attribute update. Gauges are read from live state when scraped.
+    """
+    
+    def __init__(self):
+        self.families: Dict[str, tuple] = {}  # name -> (type, help, {labels: metric})
+    
+    def register(self, name, kind, help_text):
+        self.families[name] = (kind, help_text, {})
+    
+    def get(self, name, **labels):
+        """The counter or histogram for one label combination, created on first use"""
+        kind, _, series = self.families[name]
+        key = tuple(sorted(labels.items()))
+        metric = series.get(key)
+        if metric is None:
+            metric = series[key] = Histogram() if kind == 'histogram' else MetricCounter()
+        return metric
+    
+    def render(self, gauges) -> str:
+        """Every metric, plus gauges given as (name, help, value) tuples"""
+        lines = []
+        for name, (kind, help_text, series) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series.items():
+                if kind != 'histogram':
+                    lines.append(f"{name}{format_labels(labels)} {metric.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(METRIC_BUCKETS + ('+Inf',), metric.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {metric.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        for name, help_text, value in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels) -> str:
+    """{key="value",...} with values escaped as the text format requires"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+drawing_store = BlobStore(DRAWING_STORE_MAX_BYTES)
+media_store = BlobStore(MEDIA_CACHE_BYTES)
+media_loads: Dict[tuple, asyncio.Future] = {}  # media files being read, so each is read once however many ask
+loaded_packs = OrderedDict()  # (name, digest) -> GamePack, shared by the rooms playing it
+loaded_packs_lock = threading.Lock()
+compressed_frames = BlobStore(COMPRESSION_CACHE_BYTES)
+
+# Heartbeat deadlines of connected clients. A message only updates the
+# client's last_heartbeat; the wheel re-checks it when its old deadline is due.
+heartbeats = TimerWheel(HEARTBEAT_TICK)
+
+metrics = Metrics()
+metrics.register("jeopardy_messages_total", "counter", "Messages received, by command (unknown or not allowed: unknown)")
+metrics.register("jeopardy_command_duration_seconds", "histogram", "Time spent handling a message, by command")
+metrics.register("jeopardy_message_errors_total", "counter", "Messages whose handler raised an error")
+metrics.register("jeopardy_rate_limited_total", "counter", "Messages rejected by a rate limit, by limit")
+metrics.register("jeopardy_fanout_duration_seconds", "histogram", "Time spent encoding and queueing a broadcast, by operation")
+metrics.register("jeopardy_send_failures_total", "counter", "Frames not delivered, by reason")
+metrics.register("jeopardy_connections_total", "counter", "WebSocket connections accepted")
+metrics.register("jeopardy_event_loop_lag_seconds", "histogram", "How late the event loop ran a timer")
+metrics.register("jeopardy_compression_frames_total", "counter",
+                 "Outgoing frames on deflate connections: compressed, shared (reused a compression) or skipped")
+metrics.register("jeopardy_compression_bytes_total", "counter", "Bytes of compressed frames before and after compression")
+metrics.register("jeopardy_compression_seconds_total", "counter", "Time spent compressing outgoing frames")
+UNKNOWN_MESSAGES = metrics.get("jeopardy_messages_total", command="unknown")
+MESSAGE_ERRORS = metrics.get("jeopardy_message_errors_total")
+CONNECTIONS_ACCEPTED = metrics.get("jeopardy_connections_total")
+LOOP_LAG = metrics.get("jeopardy_event_loop_lag_seconds")
+FANOUT_TIMINGS = {
+    operation: metrics.get("jeopardy_fanout_duration_seconds", operation=operation)
+    for operation in ("update_clients", "broadcast_to_clients", "relay_drawing", "spectators")
+}
+SEND_FAILURES = {
+    reason: metrics.get("jeopardy_send_failures_total", reason=reason)
+    for reason in ("closed", "overflow", "timeout", "error")
+}
+COMPRESSION_FRAMES = {
+    result: metrics.get("jeopardy_compression_frames_total", result=result)
+    for result in ("compressed", "shared", "skipped")
+}
+COMPRESSION_BYTES = {
+    stage: metrics.get("jeopardy_compression_bytes_total", stage=stage)
+    for stage in ("raw", "compressed")
+}
+COMPRESSION_TIME = metrics.get("jeopardy_compression_seconds_total")
+
+def pack_compact_value(value) -> bytes:
+    """Encode one delta op argument (see COMPACT_OPS)"""
+    if isinstance(value, bool):
+        return b'\x01' if value else b'\x00'
+    if isinstance(value, int):
+        return struct.pack('!q', value)
+    if isinstance(value, str):
+        encoded = value.encode()
+        return bytes((len(encoded),)) + encoded
+    if isinstance(value, dict):
+        return struct.pack('!H', len(value)) + b''.join(
+            pack_compact_value(name) + pack_compact_value(score) for name, score in value.items()
+        )
+    raise ValueError(f"Cannot encode {type(value).__name__} compactly")
+
+def unpack_compact_values(data, offset, types):
+    """Decode values written by pack_compact_value; returns (values, offset after them)
+    
+    types has one letter per value: s name, b boolean, q number.
+    """
+    values = []
+    for kind in types:
+        if kind == 's':
+            end = offset + 1 + data[offset]
+            values.append(bytes(data[offset + 1:end]).decode())
+            offset = end
+        elif kind == 'b':
+            values.append(data[offset] != 0)
+            offset += 1
+        else:
+            values.append(struct.unpack_from('!q', data, offset)[0])
+            offset += 8
+    return values, offset
+
+def encode_compact_delta(base, version, ops) -> Optional[bytes]:
+    """Binary form of a delta frame, or None if some op does not fit the format"""
+    try:
+        return COMPACT_DELTA_HEADER.pack(BINARY_STATE_DELTA, base, version, len(ops)) + b''.join(
+            bytes((COMPACT_OPS[name],)) + b''.join(pack_compact_value(value) for value in args)
+            for name, *args in ops
+        )
+    except (KeyError, ValueError, struct.error):
+        return None
+
+def image_mime_type(image) -> Optional[str]:
+    """Image type from its magic bytes, or None if it is not a supported image"""
+    if image[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if image[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if image[:4] == b'RIFF' and image[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def store_text_drawing(image_data) -> str:
+    """Keep a text-format drawing (a data URL) in the store; returns its hash"""
+    digest = hashlib.sha256(image_data.encode()).hexdigest()
+    drawing_store.put((digest, False), f"DRAWING_DATA:{digest}:{image_data}")
+    return digest
+
+def store_binary_drawing(image) -> str:
+    """Keep a binary drawing (raw image bytes, a memoryview) in the store; returns its hash"""
+    digest = hashlib.sha256(image)
+    drawing_store.put((digest.hexdigest(), True), b''.join((bytes((BINARY_DRAWING_DATA,)), digest.digest(), image)))
+    return digest.hexdigest()
+
+def drawing_frame(digest, binary):
+    """The DRAWING_DATA frame for a hash in the requested format
+    
+    A drawing stored in the other format is converted once and cached.
+    """
+    frame = drawing_store.get((digest, binary))
+    if frame is not None:
+        return frame
+    
+    other = drawing_store.get((digest, not binary))
+    if other is None:
+        return None
+    if binary:
+        # Text drawings are data URLs: data:<mime>;base64,<data>
+        _, _, image_data = other.split(':', 2)
+        header, _, encoded = image_data.partition(',')
+        if not header.endswith(';base64'):
+            return other
+        try:
+            image = base64.b64decode(encoded, validate=True)
+        except ValueError:
+            image = b''
+        if not image:
+            # Not valid base64 (text submissions are relayed as sent): keep the text frame
+            return other
+        frame = b''.join((bytes((BINARY_DRAWING_DATA,)), bytes.fromhex(digest), image))
+    else:
+        image = memoryview(other)[33:]
+        frame = f"DRAWING_DATA:{digest}:data:{image_mime_type(image)};base64,{base64.b64encode(image).decode()}"
+    drawing_store.put((digest, binary), frame)
+    return frame
+
+class GamePack:
+    """A compiled game pack: the board as flat columns indexed by clue id
+    
+    Clues are numbered in pack order. Category c holds clue ids
+    category_starts[c] up to category_starts[c + 1], and round r holds
+    categories round_starts[r] up to round_starts[r + 1]. clue_media is an
+    index into media_paths, or -1; media files are only read when fetched.
+    """
+    
+    def __init__(self):
+        self.name = None
+        self.digest = None
+        self.title = ""
+        self.round_names = []
+        self.round_starts = array('i', [0])
+        self.category_names = []
+        self.category_starts = array('i', [0])
+        self.values = array('i')
+        self.clues = []
+        self.answers = []
+        self.clue_media = array('i')
+        self.media_paths = []
+    
+    def compiled(self) -> bytes:
+        """The board in the compiled-cache format"""
+        return marshal.dumps((
+            PACK_FORMAT_VERSION, self.title, self.round_names, self.round_starts.tobytes(),
+            self.category_names, self.category_starts.tobytes(), self.values.tobytes(),
+            self.clues, self.answers, self.clue_media.tobytes(), self.media_paths,
+        ))
+    
+    def load_compiled(self, data):
+        (version, self.title, self.round_names, round_starts, self.category_names, category_starts,
+         values, self.clues, self.answers, clue_media, self.media_paths) = marshal.loads(data)
+        if version != PACK_FORMAT_VERSION:
+            raise ValueError(f"compiled format {version}")
+        for column, raw in ((self.round_starts, round_starts), (self.category_starts, category_starts),
+                            (self.values, values), (self.clue_media, clue_media)):
+            del column[:]
+            column.frombytes(raw)
+    
+    def board(self, revealed, host) -> str:
+        """The board message: clue ids and values for players, plus clues, answers and media for the host"""
+        rounds = []
+        for r, round_name in enumerate(self.round_names):
+            categories = []
+            for c in range(self.round_starts[r], self.round_starts[r + 1]):
+                ids = range(self.category_starts[c], self.category_starts[c + 1])
+                if host:
+                    clues = [[i, self.values[i], self.clues[i], self.answers[i],
+                              self.clue_media[i] if self.clue_media[i] >= 0 else None] for i in ids]
+                else:
+                    clues = [[i, self.values[i]] for i in ids]
+                categories.append({"name": self.category_names[c], "clues": clues})
+            rounds.append({"name": round_name, "categories": categories})
+        return json.dumps({"type": "board", "pack": self.name, "title": self.title,
+                           "rounds": rounds, "revealed": sorted(revealed)})
+    
+    def clue_frame(self, clue_id) -> str:
+        """A clue reveal: its id and text, and its media as an id to fetch"""
+        media = self.clue_media[clue_id]
+        return json.dumps({"type": "clue", "id": clue_id, "text": self.clues[clue_id],
+                           "media": media if media >= 0 else None})
+    
+    def read_media(self, media_id) -> bytes:
+        path = os.path.join(PACK_DIR, self.name, self.media_paths[media_id])
+        if os.path.getsize(path) > MAX_MEDIA_BYTES:
+            raise ValueError(f"media file over {MAX_MEDIA_BYTES} bytes")
+        with open(path, 'rb') as media_file:
+            return media_file.read()
+
+def pack_text(entry, key, where, required=True) -> str:
+    value = entry.get(key, None if required else "")
+    if not isinstance(value, str) or len(value) > MAX_PACK_TEXT_LENGTH:
+        raise ValueError(f"{where}: {key} must be a string of at most {MAX_PACK_TEXT_LENGTH} characters")
+    return value
+
+def pack_list(entry, key, where) -> list:
+    value = entry.get(key) if isinstance(entry, dict) else None
+    if not isinstance(value, list):
+        raise ValueError(f"{where}: {key} must be a list")
+    return value
+
+def compile_pack(data) -> GamePack:
+    """Check a pack's JSON and lay its board out in columns
+    
+    A pack is {"title", "rounds": [{"name", "categories": [{"name", "clues":
+    [{"value", "clue", "answer", "media"}]}]}]}, where media (optional) is a
+    path under the pack's media directory.
+    """
+    pack = GamePack()
+    document = json.loads(data)
+    if not isinstance(document, dict):
+        raise ValueError("a pack must be a JSON object")
+    pack.title = pack_text(document, "title", "pack", required=False)
+    media_ids = {}
+    for r, round_entry in enumerate(pack_list(document, "rounds", "pack")):
+        where = f"round {r + 1}"
+        categories = pack_list(round_entry, "categories", where)
+        pack.round_names.append(pack_text(round_entry, "name", where))
+        for c, category in enumerate(categories):
+            where = f"round {r + 1} category {c + 1}"
+            clues = pack_list(category, "clues", where)
+            pack.category_names.append(pack_text(category, "name", where))
+            for n, clue in enumerate(clues):
+                where = f"round {r + 1} category {c + 1} clue {n + 1}"
+                if not isinstance(clue, dict):
+                    raise ValueError(f"{where}: must be an object")
+                value = clue.get("value", 0)
+                if type(value) is not int or not 0 <= value < 1_000_000_000:
+                    raise ValueError(f"{where}: value must be a whole number")
+                pack.values.append(value)
+                pack.clues.append(pack_text(clue, "clue", where))
+                pack.answers.append(pack_text(clue, "answer", where))
+                media = clue.get("media")
+                if media is None:
+                    pack.clue_media.append(-1)
+                    continue
+                path = os.path.normpath(pack_text(clue, "media", where))
+                if os.path.isabs(path) or path == os.curdir or path.split(os.sep)[0] == os.pardir:
+                    raise ValueError(f"{where}: media must be a path inside the pack's media directory")
+                pack.clue_media.append(media_ids.setdefault(path, len(media_ids)))
+            pack.category_starts.append(len(pack.clues))
+        pack.round_starts.append(len(pack.category_names))
+    pack.media_paths = list(media_ids)
+    return pack
+
+def load_pack(name) -> GamePack:
+    """Load PACK_DIR/<name>.json, compiling it only if its contents are new
+    
+    Runs in a worker thread so a large pack never stalls the event loop.
+    Packs already loaded are shared between rooms; otherwise the compiled
+    board is read from PACK_CACHE_DIR if one was saved for these contents.
+    """
+    with open(os.path.join(PACK_DIR, name + '.json'), 'rb') as pack_file:
+        data = pack_file.read(MAX_PACK_BYTES + 1)
+    if len(data) > MAX_PACK_BYTES:
+        raise ValueError(f"pack over {MAX_PACK_BYTES} bytes")
+    digest = hashlib.sha256(data).hexdigest()
+    with loaded_packs_lock:
+        pack = loaded_packs.get((name, digest))
+        if pack is not None:
+            loaded_packs.move_to_end((name, digest))
+            return pack
+    
+    pack = GamePack()
+    compiled_path = os.path.join(PACK_CACHE_DIR, digest + '.board') if PACK_CACHE_DIR else None
+    try:
+        # The compiled cache is written by this server only; marshal does not guard against tampering
+        with open(compiled_path, 'rb') as compiled_file:
+            pack.load_compiled(compiled_file.read())
+    except (TypeError, OSError, ValueError, EOFError):
+        pack = compile_pack(data)
+        if compiled_path:
+            try:
+                os.makedirs(PACK_CACHE_DIR, exist_ok=True)
+                with open(f"{compiled_path}.{os.getpid()}.tmp", 'wb') as compiled_file:
+                    compiled_file.write(pack.compiled())
+                os.replace(f"{compiled_path}.{os.getpid()}.tmp", compiled_path)
+            except OSError as e:
+                logger.warning("Could not save compiled pack %s: %s", name, e)
+    pack.name = name
+    pack.digest = digest
+    
+    with loaded_packs_lock:
+        loaded_packs[(name, digest)] = pack
+        while len(loaded_packs) > LOADED_PACKS_MAX:
+            loaded_packs.popitem(last=False)
+    return pack
+
+def media_frame(pack, media_id, data, binary):
+    """The MEDIA_DATA frame for a pack's media file in the requested format"""
+    if binary:
+        return MEDIA_HEADER.pack(BINARY_MEDIA_DATA, media_id) + data
+    mime = mimetypes.guess_type(pack.media_paths[media_id])[0] or image_mime_type(data) or 'application/octet-stream'
+    return f"MEDIA_DATA:{media_id}:data:{mime};base64,{base64.b64encode(data).decode()}"
+
+class GameRoom:
+    """One game: its host, players, buzz queue, scores and broadcasts
+    
+    Every broadcast goes only to the room's own members, and each room
+    batches its own state updates, so many rooms share one event loop
+    without seeing each other's traffic.
+    """
+    
+    def __init__(self, code):
+        self.code = code
+        # Members in join order (a dict used as an ordered set keeps connected_players stable)
+        self.clients: Dict[websockets.WebSocketServerProtocol, None] = {}
+        self.host_socket = None
+        self.buzz_lock = False
+        self.buzz_queue = []
+        self.drawing_mode = False
+        self.live_drawing = False  # DRAWING_MODE:LIVE, players stream strokes as they draw
+        self.currently_drawing = []  # Track who is currently drawing
+        # Live drawing: each player's strokes this round, by stroke id, and the
+        # segments not yet sent to the host
+        self.stroke_logs: Dict[str, Dict[int, dict]] = {}
+        self.stroke_points: Dict[str, int] = {}
+        self.pending_strokes: Dict[str, list] = {}
+        self.stroke_handle: Optional[asyncio.TimerHandle] = None
+        self.drawings = set()  # hashes of this round's drawings, fetchable by members
+        self.player_scores: Dict[str, int] = {}
+        self.scoreboard_enabled = False
+        # Delta protocol: every flushed batch of changes bumps the state version
+        self.state_version = 0
+        self.pending_ops = []
+        self.pending_win = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.delta_history = deque(maxlen=DELTA_HISTORY)  # ops of the latest flushed versions, oldest first
+        # Resume tokens of connected clients, and of dropped ones for SESSION_RESUME_WINDOW
+        self.sessions: Dict[str, ClientSession] = {}
+        self.final: Optional[FinalRound] = None
+        # The loaded game pack, and the clues (and their media) revealed so far
+        self.pack: Optional[GamePack] = None
+        self.revealed = set()
+        self.revealed_media = set()
+        # The players' board message, encoded once per change, and the state
+        # version current when the board last changed
+        self.player_board: Optional[str] = None
+        self.board_version = 0
+        # Spectators are kept apart from clients: no ClientState, no handshake,
+        # and throttled updates encoded once per format ('json' or 'zlib')
+        self.spectators: Dict[websockets.WebSocketServerProtocol, None] = {}
+        self.spectator_feeds = {'json': SpectatorFeed(), 'zlib': SpectatorFeed()}
+        self.spectator_handle: Optional[asyncio.TimerHandle] = None
+        self.spectator_win = None
+        self.spectators_updated = 0.0
+        self.last_active = time.monotonic()
+    
+    def record(self, *op):
+        """Note a game-state change to go out with the next delta update"""
+        self.pending_ops.append(op)
+
+    def journal(self, event, *args):
+        """Append a game-state change (already made) to the game journal, if one is open"""
+        if game_journal is not None:
+            game_journal.append(self.code, event, args)
+
+    def apply_event(self, event, args):
+        """Redo one journaled change (see JOURNAL_EVENTS) during recovery"""
+        if event == "player":
+            self.player_scores.setdefault(args[0], 0)
+        elif event == "buzz":
+            if args[0] not in self.buzz_queue:
+                self.buzz_queue.append(args[0])
+        elif event == "boot":
+            if self.buzz_queue:
+                self.buzz_queue.pop(0)
+        elif event in ("win", "lock"):
+            self.buzz_queue = []
+            self.buzz_lock = False
+        elif event == "unlock":
+            self.buzz_lock = True
+        elif event == "leave_queue":
+            if args[0] in self.buzz_queue:
+                self.buzz_queue.remove(args[0])
+        elif event == "score":
+            if args[0] in self.player_scores:
+                self.player_scores[args[0]] += args[1]
+        elif event == "scoreboard":
+            self.scoreboard_enabled = args[0]
+        elif event == "drawing_mode":
+            self.drawing_mode = args[0] in ("ON", "LIVE")
+            self.live_drawing = (args[0] == "LIVE")
+        elif event == "reset":
+            self.buzz_lock = False
+            self.buzz_queue = []
+            self.drawing_mode = False
+            self.live_drawing = False
+            for player in self.player_scores:
+                self.player_scores[player] = 0
+
+    def journal_state(self) -> dict:
+        """The state a journal snapshot keeps for this room"""
+        return {
+            "scores": self.player_scores,
+            "queue": self.buzz_queue,
+            "buzz_lock": self.buzz_lock,
+            "scoreboard_enabled": self.scoreboard_enabled,
+            "drawing_mode": "LIVE" if self.live_drawing else "ON" if self.drawing_mode else "OFF",
+        }
+
+    def restore_state(self, state):
+        """Load state saved by journal_state"""
+        self.player_scores = dict(state["scores"])
+        self.buzz_queue = list(state["queue"])
+        self.buzz_lock = state["buzz_lock"]
+        self.scoreboard_enabled = state["scoreboard_enabled"]
+        self.apply_event("drawing_mode", (state["drawing_mode"],))
+
+    def build_snapshot(self, win_player=None) -> str:
+        """Encode the full game state (the pre-delta message format plus its version)"""
+        game_state = {
+            "queue": self.buzz_queue,
+            "win_player": win_player,
+            "connected_players": self.connected_players(),
+            "buzz_lock": self.buzz_lock,
+            "scoreboard_enabled": self.scoreboard_enabled,
+            "version": self.state_version
+        }
+        
+        # Include scores if scoreboard is enabled
+        if self.scoreboard_enabled:
+            game_state["scores"] = self.player_scores
+        
+        return json.dumps(game_state)
+    
+    def update_clients(self, win_player=None):
+        """Schedule an update of all members with the current game state
+        
+        Changes made within BROADCAST_WINDOW of each other go out as one update,
+        so a buzz storm after UNLOCK costs a handful of broadcasts rather than
+        one per buzz. The state itself (including buzz_queue order) is always
+        updated immediately; only delivery is batched.
+        """
+        if win_player is not None:
+            self.pending_win = win_player
+            self.record("win", win_player)
+        
+        if BROADCAST_WINDOW <= 0:
+            self.flush_updates()
+        else:
+            self.schedule_flush(BROADCAST_WINDOW)
+    
+    def update_presence(self):
+        """Schedule an update for players joining or leaving
+        
+        Joins and leaves wait up to PRESENCE_DEBOUNCE, so players coming back
+        together after a network blip cost one update rather than one each.
+        Any game change in the meantime sends them along at once.
+        """
+        if PRESENCE_DEBOUNCE <= 0:
+            self.update_clients()
+        else:
+            self.schedule_flush(PRESENCE_DEBOUNCE)
+    
+    def schedule_flush(self, delay):
+        """Flush within delay seconds, keeping an earlier flush if one is scheduled"""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self.flush_handle is not None:
+            if self.flush_handle.when() <= when:
+                return
+            self.flush_handle.cancel()
+        self.flush_handle = loop.call_at(when, self.flush_updates)
+    
+    def flush_pending(self):
+        """Send a scheduled update now, so frames queued next are ordered after it"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_updates()
+    
+    def flush_updates(self):
+        """Send everything recorded since the last update
+        
+        Delta clients get one small frame listing the changes; everyone else gets
+        the full snapshot. Each frame is encoded once, and only if someone needs it.
+        """
+        self.flush_handle = None
+        win_player, self.pending_win = self.pending_win, None
+        ops, self.pending_ops = self.pending_ops, []
+        base = self.state_version
+        if ops:
+            self.state_version += 1
+            self.delta_history.append(ops)
+        self.schedule_spectator_update(win_player)
+        
+        if not self.clients:
+            return
+        
+        start = time.perf_counter()
+        delta_clients = []
+        compact_clients = []
+        snapshot_clients = []
+        for client in self.clients:
+            features = client_info[client].features
+            if 'delta' not in features:
+                snapshot_clients.append(client)
+            elif 'compact' in features:
+                compact_clients.append(client)
+            else:
+                delta_clients.append(client)
+        
+        if compact_clients and ops:
+            frame = encode_compact_delta(base, self.state_version, ops)
+            if frame is None:
+                delta_clients += compact_clients
+            else:
+                fan_out(compact_clients, frame)
+        
+        if delta_clients and ops:
+            fan_out(delta_clients, json.dumps({"type": "delta", "base": base, "version": self.state_version, "ops": ops}))
+        
+        if snapshot_clients:
+            # A newer snapshot replaces any still waiting in an outbox
+            fan_out(snapshot_clients, self.build_snapshot(win_player), snapshot=True)
+        FANOUT_TIMINGS["update_clients"].observe(time.perf_counter() - start)
+    
+    def schedule_spectator_update(self, win_player=None):
+        """Publish the state to spectators within SPECTATOR_UPDATE_INTERVAL of the last update"""
+        if win_player is not None:
+            self.spectator_win = win_player
+        if self.spectator_handle is not None or not self.spectators:
+            return
+        delay = max(0.0, self.spectators_updated + SPECTATOR_UPDATE_INTERVAL - time.monotonic())
+        self.spectator_handle = asyncio.get_running_loop().call_later(delay, self.publish_spectator_frames)
+    
+    def publish_spectator_frames(self):
+        """Encode the game state once per format in use and wake every spectator"""
+        if self.spectator_handle is not None:
+            self.spectator_handle.cancel()
+            self.spectator_handle = None
+        start = time.perf_counter()
+        self.spectators_updated = time.monotonic()
+        win_player, self.spectator_win = self.spectator_win, None
+        snapshot = self.build_snapshot(win_player)
+        json_feed, zlib_feed = self.spectator_feeds['json'], self.spectator_feeds['zlib']
+        if json_feed.subscribers:
+            json_feed.publish(snapshot)
+        if zlib_feed.subscribers:
+            zlib_feed.publish(bytes((BINARY_SPECTATOR_STATE,)) + zlib.compress(snapshot.encode(), SPECTATOR_COMPRESSION_LEVEL))
+        FANOUT_TIMINGS["spectators"].observe(time.perf_counter() - start)
+    
+    def catch_up(self, version, features):
+        """The frame that brings a client from version (the last it saw) to the current state
+        
+        A delta client gets the batches since then as one delta, if they are
+        still in delta_history; otherwise, or with no version, a snapshot.
+        None if the client is already up to date.
+        """
+        if 'delta' in features and version is not None:
+            missed = self.state_version - version
+            if missed == 0:
+                return None
+            if 0 < missed <= len(self.delta_history):
+                ops = [op for batch in list(self.delta_history)[-missed:] for op in batch]
+                frame = None
+                if 'compact' in features:
+                    frame = encode_compact_delta(version, self.state_version, ops)
+                if frame is None:
+                    frame = json.dumps({"type": "delta", "base": version, "version": self.state_version, "ops": ops})
+                return frame
+        if 'delta' in features:
+            # A delta client's snapshot must not include changes still to be sent as deltas
+            self.flush_pending()
+        return self.build_snapshot()
+    
+    def open_session(self, websocket, client_data):
+        """Issue a resume token to a client that has just joined"""
+        session = ClientSession(client_data.username, client_data.is_host, websocket)
+        client_data.session = session
+        self.sessions[session.token] = session
+        safe_send(websocket, json.dumps({"type": "session", "token": session.token,
+                                         "resume_window": SESSION_RESUME_WINDOW}))
+    
+    def hold_session(self, session):
+        """Keep a dropped client's session for SESSION_RESUME_WINDOW"""
+        session.websocket = None
+        session.expiry = asyncio.get_running_loop().call_later(SESSION_RESUME_WINDOW, self.expire_session, session)
+    
+    def expire_session(self, session):
+        """A dropped session was not resumed in time: the player gives up their queue place"""
+        session.expiry = None
+        self.sessions.pop(session.token, None)
+        if session.is_host or session.username not in self.buzz_queue:
+            return
+        self.buzz_queue.remove(session.username)
+        self.record("queue_remove", session.username)
+        self.journal("leave_queue", session.username)
+        logger.info("Removed %s from buzz queue, session expired", session.username)
+        self.update_clients()
+    
+    def release_sessions(self, username):
+        """Forget the dropped sessions of a player who has joined again by name"""
+        for token, session in list(self.sessions.items()):
+            if session.username == username and session.websocket is None and not session.is_host:
+                session.expiry.cancel()
+                del self.sessions[token]
+    
+    def attach_host(self, websocket):
+        """Make a connection the room's host and catch it up on anything in progress"""
+        if self.host_socket is not None:
+            logger.warning("New host connection replacing existing host in room %s", self.code)
+        self.host_socket = websocket
+        if self.live_drawing:
+            # A reconnecting host catches up on the round so far
+            safe_send(websocket, self.stroke_replay())
+        if self.final is not None and self.final.delivered is not None:
+            safe_send(websocket, self.final.delivered)
+        if self.pack is not None:
+            safe_send(websocket, self.pack.board(self.revealed, True))
+    
+    def board_frame(self) -> str:
+        """The players' board message, shared by every join and resume until the board changes"""
+        if self.player_board is None:
+            self.player_board = self.pack.board(self.revealed, False)
+        return self.player_board
+    
+    def board_changed(self):
+        """Note a new pack or revealed clue: the next board_frame() is encoded again
+        
+        Call it just before sending the change. A scheduled update goes out
+        first, so no client sees a version above board_version before the change.
+        """
+        self.flush_pending()
+        self.player_board = None
+        self.board_version = self.state_version
+    
+    def connected_players(self) -> list:
+        return [
+            client_info[client].username for client in self.clients
+            if client_info[client].username and not client_info[client].is_host
+        ]
+    
+    def open_final_phase(self, phase, seconds):
+        """Start collecting wagers or answers until the deadline
+        
+        Wagers still being collected when answers open go to the host first.
+        """
+        final = self.final
+        if final is None:
+            final = self.final = FinalRound()
+        elif final.phase == 'wagers':
+            self.close_final_phase()
+        if final.deadline is not None:
+            final.deadline.cancel()
+        final.phase = phase
+        final.deadline = asyncio.get_running_loop().call_later(seconds, self.close_final_phase)
+    
+    def final_submitted(self):
+        """Close the phase early once every connected player has sent their entry"""
+        final = self.final
+        entries = final.wagers if final.phase == 'wagers' else final.answers
+        if all(player in entries for player in self.connected_players()):
+            self.close_final_phase()
+    
+    def close_final_phase(self):
+        """Send the host everything collected in the current phase, as one message"""
+        final = self.final
+        if final is None or final.phase not in ('wagers', 'answers'):
+            return
+        if final.deadline is not None:
+            final.deadline.cancel()
+            final.deadline = None
+        
+        connected = self.connected_players()
+        if final.phase == 'wagers':
+            final.phase = None
+            final.delivered = json.dumps({
+                "type": "final_wagers",
+                "wagers": final.wagers,
+                "missing": [player for player in connected if player not in final.wagers],
+            })
+        else:
+            final.phase = 'judging'
+            players = list(final.answers) + [player for player in final.wagers if player not in final.answers]
+            final.delivered = json.dumps({
+                "type": "final_answers",
+                "entries": [
+                    {"username": player, "wager": final.wagers.get(player), "answer": final.answers.get(player)}
+                    for player in players
+                ],
+                "missing": [player for player in connected if player not in final.answers],
+            })
+        logger.info("Final Jeopardy %s closed in room %s", "answers" if final.phase == 'judging' else "wagers", self.code)
+        if self.host_socket is not None:
+            safe_send(self.host_socket, final.delivered)
+    
+    def apply_final_results(self, verdicts):
+        """Score the judged answers in one batch and announce the results
+        
+        verdicts maps players to True (correct) or False. Each wins or loses
+        their wager, read as a whole number and capped at their score; a
+        wager that is not a number counts as 0.
+        """
+        final = self.final
+        results = []
+        changes = {}
+        for player, correct in verdicts.items():
+            if player not in self.player_scores or (player not in final.wagers and player not in final.answers):
+                continue
+            score = self.player_scores[player]
+            wager = final.wagers.get(player, '').replace('$', '').replace(',', '').strip()
+            amount = min(int(wager), max(score, 0)) if wager.isdecimal() else 0
+            change = amount if correct else -amount
+            changes[player] = change
+            results.append({"username": player, "wager": final.wagers.get(player), "answer": final.answers.get(player),
+                            "correct": correct, "change": change, "score": score + change})
+        
+        for player, change in changes.items():
+            self.player_scores[player] += change
+            self.journal("score", player, change)
+        if changes and self.scoreboard_enabled:
+            self.record("scores", dict(self.player_scores))
+        self.final = None
+        logger.info("Final Jeopardy scored in room %s: %s players", self.code, len(changes))
+        
+        frame = json.dumps({"type": "final_results", "results": results})
+        self.broadcast_to_clients(frame)
+        if self.host_socket is not None:
+            safe_send(self.host_socket, frame)
+        self.update_clients()
+    
+    def cancel_final(self):
+        if self.final is not None and self.final.deadline is not None:
+            self.final.deadline.cancel()
+        self.final = None
+    
+    def broadcast_to_clients(self, message):
+        """Broadcast a message to all non-host members"""
+        if not self.clients:
+            return
+        
+        self.flush_pending()
+        start = time.perf_counter()
+        fan_out([client for client in self.clients if client != self.host_socket], message)
+        FANOUT_TIMINGS["broadcast_to_clients"].observe(time.perf_counter() - start)
+    
+    def relay_drawing(self, ref_frame, text_frame, binary_frame=None):
+        """Send a drawing to every member in the form it asked for
+        
+        Clients with FEATURES:blobs get the reference, clients with
+        FEATURES:binary get a binary submission unchanged, and everyone else
+        gets the text DRAWING_SUBMIT frame. text_frame may be a function so a
+        binary drawing is only converted if some member needs it.
+        """
+        self.flush_pending()
+        start = time.perf_counter()
+        ref_clients = []
+        binary_clients = []
+        text_clients = []
+        for client in self.clients:
+            features = client_info[client].features
+            if 'blobs' in features:
+                ref_clients.append(client)
+            elif binary_frame is not None and 'binary' in features:
+                binary_clients.append(client)
+            else:
+                text_clients.append(client)
+        
+        fan_out(ref_clients, ref_frame)
+        fan_out(binary_clients, binary_frame)
+        if text_clients:
+            fan_out(text_clients, text_frame() if callable(text_frame) else text_frame)
+        FANOUT_TIMINGS["relay_drawing"].observe(time.perf_counter() - start)
+    
+    def add_strokes(self, username, segments):
+        """Append a player's stroke segments to their log and queue them for the host
+        
+        Returns False if the player's log for this round is full.
+        """
+        log = self.stroke_logs.setdefault(username, {})
+        points = self.stroke_points.get(username, 0) + sum(len(segment['p']) // 2 for segment in segments)
+        if points > MAX_STROKE_POINTS:
+            return False
+        self.stroke_points[username] = points
+        
+        for segment in segments:
+            stroke = log.get(segment['id'])
+            if stroke is None:
+                log[segment['id']] = dict(segment, p=list(segment['p']))
+            else:
+                stroke['p'].extend(segment['p'])
+        
+        pending = self.pending_strokes.setdefault(username, [])
+        for segment in segments:
+            # Segments of one stroke within a tick go to the host as one
+            if pending and pending[-1].get('id') == segment['id']:
+                pending[-1]['p'].extend(segment['p'])
+            else:
+                pending.append(segment)
+        if self.stroke_handle is None:
+            self.stroke_handle = asyncio.get_running_loop().call_later(STROKE_TICK, self.flush_strokes)
+        return True
+    
+    def clear_strokes(self, username=None):
+        """Forget one player's strokes (telling the host), or everyone's at the end of a round"""
+        if username is None:
+            self.stroke_logs = {}
+            self.stroke_points = {}
+            self.pending_strokes = {}
+            if self.stroke_handle is not None:
+                self.stroke_handle.cancel()
+                self.stroke_handle = None
+            return
+        
+        self.stroke_logs.pop(username, None)
+        self.stroke_points.pop(username, None)
+        # Segments the host has not seen yet are moot
+        self.pending_strokes[username] = [{"clear": True}]
+        if self.stroke_handle is None:
+            self.stroke_handle = asyncio.get_running_loop().call_later(STROKE_TICK, self.flush_strokes)
+    
+    def flush_strokes(self):
+        """Send the host one frame with every player's segments since the last tick"""
+        self.stroke_handle = None
+        pending, self.pending_strokes = self.pending_strokes, {}
+        if pending and self.host_socket is not None:
+            safe_send(self.host_socket, "STROKES:" + json.dumps(pending))
+    
+    def stroke_replay(self, username=None) -> str:
+        """Everyone's strokes this round (or one player's), one entry per stroke"""
+        if username is None:
+            logs = self.stroke_logs
+        else:
+            logs = {username: self.stroke_logs.get(username, {})}
+        return "STROKE_REPLAY:" + json.dumps({player: list(log.values()) for player, log in logs.items()})
+    
+    def close(self):
+        """Release the room's timers and state once it has been removed from rooms"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.spectator_handle is not None:
+            self.spectator_handle.cancel()
+            self.spectator_handle = None
+        for session in self.sessions.values():
+            if session.expiry is not None:
+                session.expiry.cancel()
+        self.sessions = {}
+        self.delta_history.clear()
+        self.cancel_final()
+        self.clear_strokes()
+        self.pending_ops = []
+        self.buzz_queue = []
+        self.currently_drawing = []
+        self.drawings = set()
+        self.player_scores = {}
+
+def room_code_from_path(path) -> str:
+    """Room code from a request path, e.g. /trivia-night?x=1 -> trivia-night"""
+    code = path.split('?', 1)[0].strip('/').lower()
+    return code or DEFAULT_ROOM
+
+def request_path(websocket) -> str:
+    request = getattr(websocket, 'request', None)
+    return request.path if request is not None else getattr(websocket, 'path', '/')
+
+def requested_room_code(websocket) -> str:
+    """Room code from the connection path, e.g. ws://server:9999/trivia-night"""
+    return room_code_from_path(request_path(websocket))
+
+def spectator_format_from_path(path) -> Optional[str]:
+    """'json' for /room?spectate, 'zlib' for /room?spectate=zlib, None for players"""
+    values = parse_qs(path.partition('?')[2], keep_blank_values=True).get('spectate')
+    if values is None:
+        return None
+    return 'zlib' if values[0] == 'zlib' else 'json'
+
+def peer_address(websocket):
+    """Client address for logs; behind the worker router it comes from X-Forwarded-For"""
+    if TRUST_FORWARDED_FOR:
+        request = getattr(websocket, 'request', None)
+        forwarded = request.headers.get_all('X-Forwarded-For') if request is not None else []
+        if forwarded:
+            # The router adds its header first, ahead of anything the client sent
+            return forwarded[0]
+    return websocket.remote_address
+
+def get_room(code) -> Optional[GameRoom]:
+    """Return the room for a code, creating it if there is capacity"""
+    room = rooms.get(code)
+    if room is None:
+        if len(rooms) >= MAX_ROOMS:
+            return None
+        room = rooms[code] = GameRoom(code)
+        logger.info("Created room %s (%s rooms open)", code, len(rooms))
+    return room
+
+def close_room(room, reason="Room closed"):
+    """Disconnect every member of a room and reclaim it"""
+    for client in list(room.clients) + list(room.spectators):
+        asyncio.create_task(client.close(code=1001, reason=reason))
+    if rooms.get(room.code) is room:
+        del rooms[room.code]
+        room.journal("close")
+    room.close()
+    logger.info("Closed room %s (%s rooms open)", room.code, len(rooms))
+
+def reap_idle_rooms():
+    """Reclaim rooms that have had no members for ROOM_IDLE_TIMEOUT
+    
+    Rooms that never had a player have no scores worth keeping and are
+    reclaimed as soon as they are empty.
+    """
+    now = time.monotonic()
+    idle = [
+        room for room in rooms.values()
+        if not room.clients and not room.spectators
+        and (not room.player_scores or now - room.last_active > ROOM_IDLE_TIMEOUT)
+    ]
+    for room in idle:
+        close_room(room, reason="Room idle")
+
+class GameJournal:
+    """Append-only journal of game-state events, written by a background thread
+
+    The event loop only encodes each event and queues it. The writer thread
+    takes everything queued since its last write and commits it with one
+    write and one fsync (group commit), so the loop never waits on the disk
+    and a burst of events costs one fsync. Every JOURNAL_SNAPSHOT_EVERY
+    events the loop also queues a snapshot of every room; the writer saves
+    it, starts a new segment file and deletes the segments it covers.
+    """
+
+    def __init__(self, directory, sequence=0):
+        self.directory = directory
+        self.sequence = sequence  # number of the last event appended
+        self.snapshot_sequence = sequence
+        self.snapshot_handle: Optional[asyncio.Handle] = None
+        self.queue = queue.SimpleQueue()
+        self.commits = 0
+        self.events_written = 0
+        self.writer = threading.Thread(target=self.write_loop, name="journal-writer", daemon=True)
+        self.writer.start()
+        if sequence:
+            # Fold the replayed tail (and any damaged segment) into a fresh snapshot
+            self.snapshot()
+
+    def append(self, code, event, args):
+        """Queue one event for the writer thread"""
+        try:
+            payload = bytes((JOURNAL_EVENT_CODES[event],)) + pack_compact_value(code) + b''.join(
+                pack_compact_value(value) for value in args
+            )
+        except (ValueError, struct.error) as e:
+            logger.error("Cannot journal %s in room %s: %s", event, code, e)
+            return
+        self.sequence += 1
+        self.queue.put((self.sequence, payload))
+
+        if self.sequence - self.snapshot_sequence >= JOURNAL_SNAPSHOT_EVERY and self.snapshot_handle is None:
+            # Once the current handler has finished, so the snapshot sees all its changes
+            self.snapshot_handle = asyncio.get_running_loop().call_soon(self.snapshot)
+
+    def snapshot(self):
+        """Queue a snapshot of every room as of the last event appended"""
+        self.snapshot_handle = None
+        self.snapshot_sequence = self.sequence
+        state = json.dumps({
+            "sequence": self.sequence,
+            "rooms": {code: room.journal_state() for code, room in rooms.items()},
+        }, separators=(',', ':'))
+        self.queue.put((self.sequence, state))
+
+    def close(self):
+        """Snapshot, write out everything queued and stop the writer thread"""
+        if self.snapshot_handle is not None:
+            self.snapshot_handle.cancel()
+        self.snapshot()
+        self.queue.put(None)
+        self.writer.join()
+
+    def segment_path(self, first_sequence):
+        return os.path.join(self.directory, f"{first_sequence:020d}.journal")
+
+    def write_loop(self):
+        segment = open(self.segment_path(self.sequence + 1), 'ab')
+        while True:
+            items = [self.queue.get()]
+            try:
+                while True:
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            batch = bytearray()
+            for item in items:
+                if item is None:
+                    self.commit(segment, batch)
+                    segment.close()
+                    return
+                sequence, payload = item
+                if isinstance(payload, bytes):
+                    checksum = zlib.crc32(payload, zlib.crc32(sequence.to_bytes(8, 'big')))
+                    batch += JOURNAL_RECORD.pack(len(payload), checksum, sequence)
+                    batch += payload
+                    self.events_written += 1
+                else:
+                    # A snapshot: everything before it must be on disk first
+                    self.commit(segment, batch)
+                    batch = bytearray()
+                    segment.close()
+                    segment = self.save_snapshot(sequence, payload)
+            self.commit(segment, batch)
+
+    def commit(self, segment, batch):
+        if not batch:
+            return
+        try:
+            segment.write(batch)
+            segment.flush()
+            os.fsync(segment.fileno())
+            self.commits += 1
+        except OSError as e:
+            logger.error("Journal write failed: %s", e)
+
+    def save_snapshot(self, sequence, state):
+        """Write a snapshot atomically, then replace the journal it covers with a new segment"""
+        path = os.path.join(self.directory, "snapshot.json")
+        try:
+            with open(path + ".tmp", 'w') as snapshot_file:
+                snapshot_file.write(state)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(path + ".tmp", path)
+            if hasattr(os, 'O_DIRECTORY'):
+                directory = os.open(self.directory, os.O_DIRECTORY)
+                try:
+                    os.fsync(directory)
+                finally:
+                    os.close(directory)
+            for name in os.listdir(self.directory):
+                if name.endswith(".journal"):
+                    os.remove(os.path.join(self.directory, name))
+        except OSError as e:
+            logger.error("Journal snapshot failed: %s", e)
+        return open(self.segment_path(sequence + 1), 'ab')
+
+game_journal: Optional[GameJournal] = None
+
+def read_journal_segment(path):
+    """Yield (sequence, payload) for each intact record of a segment file
+
+    A record cut short or corrupted by a crash ends the segment.
+    """
+    with open(path, 'rb') as segment:
+        data = memoryview(segment.read())
+    offset = 0
+    while offset < len(data):
+        start = offset + JOURNAL_RECORD.size
+        if start > len(data):
+            length, checksum, sequence = 0, None, None
+        else:
+            length, checksum, sequence = JOURNAL_RECORD.unpack_from(data, offset)
+        payload = data[start:start + length]
+        if len(payload) < length or checksum != zlib.crc32(payload, zlib.crc32(data[offset + 8:start])):
+            logger.warning("Journal %s is damaged at byte %s, ignoring the rest of it", path, offset)
+            return
+        yield sequence, payload
+        offset = start + length
+
+def recover_rooms(directory) -> int:
+    """Rebuild rooms from the latest snapshot and the journal after it
+
+    Returns the sequence number of the last event recovered.
+    """
+    sequence = 0
+    started = time.perf_counter()
+    snapshot_path = os.path.join(directory, "snapshot.json")
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        sequence = snapshot["sequence"]
+        for code, state in snapshot["rooms"].items():
+            room = rooms[code] = GameRoom(code)
+            room.restore_state(state)
+
+    replayed = 0
+    for name in sorted(name for name in os.listdir(directory) if name.endswith(".journal")):
+        for record_sequence, payload in read_journal_segment(os.path.join(directory, name)):
+            if record_sequence <= sequence:
+                continue
+            sequence = record_sequence
+            replayed += 1
+            event = JOURNAL_EVENT_NAMES[payload[0]]
+            (code,), offset = unpack_compact_values(payload, 1, "s")
+            args, _ = unpack_compact_values(payload, offset, JOURNAL_EVENTS[event])
+            if event == "close":
+                rooms.pop(code, None)
+                continue
+            room = rooms.get(code)
+            if room is None:
+                room = rooms[code] = GameRoom(code)
+            room.apply_event(event, args)
+
+    if sequence:
+        logger.info("Recovered %s rooms from %s (%s events replayed) in %.1f ms",
+                    len(rooms), directory, replayed, (time.perf_counter() - started) * 1000)
+    return sequence
+
+def drop_unreturned_players():
+    """Remove recovered buzz-queue entries of players who did not come back
+    
+    Scheduled SESSION_RESUME_WINDOW after recovery: no session survives a
+    restart, so a queued player who has not rejoined by then would otherwise
+    stay in the queue (and could be picked by WIN) for good.
+    """
+    for room in list(rooms.values()):
+        present = set(room.connected_players())
+        present.update(session.username for session in room.sessions.values())
+        gone = [username for username in room.buzz_queue if username not in present]
+        for username in gone:
+            room.buzz_queue.remove(username)
+            room.record("queue_remove", username)
+            room.journal("leave_queue", username)
+        if gone:
+            logger.info("Removed %s from the buzz queue of room %s: not back after restart", gone, room.code)
+            room.update_clients()
+
+# Control characters removed by validate_input (tab, newline and carriage
+# return are kept, then collapsed with the rest of the whitespace)
+_CONTROL_CHARACTERS = dict.fromkeys(code for code in range(32) if chr(code) not in '\n\r\t')
+
+def sanitize(text: str) -> str:
+    """Remove control characters and collapse whitespace to single spaces"""
+    # Printable text has no whitespace but ' ', so it is clean unless its spaces need collapsing
+    if text.isprintable() and '  ' not in text and text[:1] != ' ' and text[-1:] != ' ':
+        return text
+    return ' '.join(text.translate(_CONTROL_CHARACTERS).split())
+
+def validate_input(text: str, max_length: int, field_name: str) -> str:
+    """Validate and sanitize input text"""
+    if not isinstance(text, str):
+        raise ValueError(f"{field_name} must be a string")
+    
+    if len(text) > max_length:
+        # Sanitizing never makes a prefix longer than the whole text, so an
+        # over-long prefix settles it without looking at the rest
+        if len(sanitize(text[:2 * max_length + 2])) > max_length:
+            raise ValueError(f"{field_name} exceeds maximum length of {max_length}")
+    
+    # Remove control characters and excessive whitespace
+    sanitized = sanitize(text)
+    
+    if len(sanitized) > max_length:
+        raise ValueError(f"{field_name} exceeds maximum length of {max_length}")
+    
+    if not sanitized:
+        raise ValueError(f"{field_name} cannot be empty")
+    
+    return sanitized
+
+def is_finite_number(value) -> bool:
+    """An int or float that is valid JSON when relayed (json.loads accepts NaN and Infinity)"""
+    return type(value) is int or (type(value) is float and math.isfinite(value))
+
+def parse_strokes(payload) -> list:
+    """Parse and validate a STROKES batch
+    
+    A batch is a JSON list of segments {"id", "p"[, "c", "w"]}: a stroke id,
+    a flat [x, y, x, y, ...] point list to append to that stroke, and the
+    colour and width, needed only on a stroke's first segment.
+    """
+    segments = json.loads(payload)
+    if not isinstance(segments, list) or not segments:
+        raise ValueError("Strokes must be a non-empty list")
+    
+    for segment in segments:
+        if not isinstance(segment, dict):
+            raise ValueError("Each stroke segment must be an object")
+        stroke_id = segment.get('id')
+        if not isinstance(stroke_id, int) or isinstance(stroke_id, bool) or not 0 <= stroke_id < 2**31:
+            raise ValueError("Stroke id must be a non-negative integer")
+        points = segment.get('p')
+        if not isinstance(points, list) or len(points) % 2:
+            raise ValueError("Stroke points must be a list of x, y pairs")
+        if not all(is_finite_number(value) for value in points):
+            raise ValueError("Stroke points must be finite numbers")
+        if 'c' in segment and not (isinstance(segment['c'], str) and len(segment['c']) <= MAX_STROKE_COLOR_LENGTH):
+            raise ValueError("Invalid stroke color")
+        if 'w' in segment and not (is_finite_number(segment['w']) and 0 < segment['w'] <= 100):
+            raise ValueError("Invalid stroke width")
+        if set(segment) - {'id', 'p', 'c', 'w'}:
+            raise ValueError("Unknown stroke field")
+    
+    return segments
+
+def rate_limit(limit_type: str):
+    """(max messages, window) for a kind of rate limit, or None if unlimited"""
+    limits = {
+        'general': (RATE_LIMIT_MAX_MESSAGES, RATE_LIMIT_WINDOW),
+        'buzz': (RATE_LIMIT_MAX_BUZZ, RATE_LIMIT_BUZZ_WINDOW),
+        'drawing': (RATE_LIMIT_MAX_DRAWINGS, RATE_LIMIT_DRAWING_WINDOW),
+        'strokes': (RATE_LIMIT_MAX_STROKES, RATE_LIMIT_STROKE_WINDOW),
+        'host': (RATE_LIMIT_MAX_HOST, RATE_LIMIT_HOST_WINDOW),
+    }
+    return limits.get(limit_type)
+
+def check_rate_limit(client_data: ClientState, limit_type: str = 'general') -> bool:
+    """Check if client is within rate limits, counting this message if it is"""
+    bucket = client_data.buckets.get(limit_type)
+    if bucket is None:
+        limit = rate_limit(limit_type)
+        if limit is None:
+            return True
+        bucket = client_data.buckets[limit_type] = TokenBucket(*limit)
+    if bucket.take(time.monotonic()):
+        return True
+    metrics.get("jeopardy_rate_limited_total", limit=limit_type).value += 1
+    return False
+
+async def handle_client(websocket):
+    # Find the room this connection asked for
+    code = requested_room_code(websocket)
+    if not ROOM_CODE_PATTERN.match(code):
+        logger.warning("Connection rejected: invalid room code from %s", peer_address(websocket))
+        await websocket.close(code=1008, reason="Invalid room code")
+        return
+    
+    room = get_room(code)
+    if room is None:
+        logger.warning("Connection rejected: max rooms (%s) reached", MAX_ROOMS)
+        await websocket.close(code=1013, reason="Server full")
+        return
+    
+    feed_format = spectator_format_from_path(request_path(websocket))
+    if feed_format is not None:
+        await handle_spectator(websocket, room, feed_format)
+        return
+    
+    # Check connection limit
+    if len(room.clients) >= MAX_CLIENTS:
+        logger.warning("Connection rejected: max clients (%s) reached in room %s", MAX_CLIENTS, code)
+        await websocket.close(code=1013, reason="Room full")
+        return
+    
+    CONNECTIONS_ACCEPTED.value += 1
+    outbox = Outbox()
+    client_data = ClientState(room, outbox, asyncio.create_task(client_writer(websocket, outbox)))
+    client_info[websocket] = client_data
+    room.clients[websocket] = None
+    heartbeats.schedule(websocket, client_data.last_heartbeat + HEARTBEAT_TIMEOUT)
+    
+    try:
+        # Wait for username (or a resume token) with timeout
+        raw_username = await asyncio.wait_for(websocket.recv(), timeout=30.0)
+        if isinstance(raw_username, str) and raw_username.startswith("RESUME:"):
+            if resume_session(websocket, client_data, raw_username[len("RESUME:"):]):
+                raw_username = None
+            else:
+                # Unknown or expired token: the client joins again by name
+                safe_send(websocket, json.dumps({"type": "session_expired"}))
+                raw_username = await asyncio.wait_for(websocket.recv(), timeout=30.0)
+        if raw_username is not None and not await join_room(websocket, client_data, raw_username):
+            return
+        username = client_data.username
+
+        async for raw_message in websocket:
+            client_data.last_heartbeat = time.monotonic()
+            
+            # Validate message length
+            if len(raw_message) > MAX_MESSAGE_LENGTH:
+                logger.warning("Message too long from %s: %s chars", username, len(raw_message))
+                safe_send(websocket, json.dumps({"error": "Message too long"}))
+                continue
+            
+            # Check general rate limit; the host and stroke batches have their own
+            if client_data.is_host:
+                limit_type = 'host'
+            elif isinstance(raw_message, str) and raw_message.startswith("STROKES:"):
+                limit_type = 'strokes'
+            else:
+                limit_type = 'general'
+            if not check_rate_limit(client_data, limit_type):
+                logger.warning("Rate limit exceeded for %s", username)
+                safe_send(websocket, json.dumps({"error": "Rate limit exceeded"}))
+                continue
+            
+            try:
+                if isinstance(raw_message, bytes):
+                    await handle_binary_message(websocket, raw_message, username)
+                else:
+                    await handle_message(websocket, raw_message, username)
+            except Exception as e:
+                MESSAGE_ERRORS.value += 1
+                logger.error("Error handling message from %s: %s", username, e)
+                safe_send(websocket, json.dumps({"error": "Message processing failed"}))
+                
+    except asyncio.TimeoutError:
+        logger.warning("Client connection timed out during setup")
+    except websockets.exceptions.ConnectionClosed:
+        logger.info("Client %s disconnected", client_data.username)
+    except Exception as e:
+        logger.error("Unexpected error in handle_client: %s", e)
+    finally:
+        cleanup_client(websocket)
+
+async def join_room(websocket, client_data, raw_username) -> bool:
+    """Join a connection as a player or, with host:<password>, as the host
+    
+    Returns False if the username or password was refused (the connection is
+    then closed).
+    """
+    room = client_data.room
+    
+    # Validate and sanitize username
+    try:
+        username = validate_input(raw_username, MAX_USERNAME_LENGTH, "Username")
+    except ValueError as e:
+        logger.warning("Invalid username from %s: %s", peer_address(websocket), e)
+        await websocket.close(code=1008, reason=str(e))
+        return False
+    
+    # Check if this is a host connection with password
+    if username.startswith("host:"):
+        parts = username.split(":", 1)
+        if len(parts) == 2 and hmac.compare_digest(parts[1].encode(), host_password.encode()):
+            username = "host"
+            client_data.is_host = True
+            logger.info("Host authenticated from %s", peer_address(websocket))
+        else:
+            logger.warning("Invalid host password attempt from %s", peer_address(websocket))
+            await websocket.close(code=1008, reason="Invalid host password")
+            return False
+    else:
+        client_data.is_host = False
+        room.record("join", username)
+        room.release_sessions(username)
+        # Initialize score for new players
+        if username not in room.player_scores:
+            room.player_scores[username] = 0
+            room.journal("player", username)
+            if room.scoreboard_enabled:
+                room.record("score", username, 0)
+    
+    client_data.username = username
+    logger.info("Client %s connected to room %s from %s", username, room.code, peer_address(websocket))
+
+    if client_data.is_host:
+        room.attach_host(websocket)
+
+    # The newcomer gets the state now; the rest of the room hears of a player
+    # joining with the next update
+    room.open_session(websocket, client_data)
+    safe_send(websocket, room.build_snapshot())
+    if not client_data.is_host:
+        if room.pack is not None:
+            safe_send(websocket, room.board_frame())
+        room.update_presence()
+    return True
+
+def resume_session(websocket, client_data, arg) -> bool:
+    """Take over the session of a resume token (RESUME:<token>[:<version>])
+    
+    The client gets back its username, features and buzz-queue place, a new
+    token (each one resumes once), and only the state it missed since the
+    version it last saw. Returns False for an unknown or expired token.
+    """
+    room = client_data.room
+    token, _, version = arg.partition(':')
+    # Checked before the session is touched, so a bad version cannot lose it
+    if version and not (version.isdecimal() and version.isascii() and len(version) <= 20):
+        logger.warning("Resume with invalid version from %s", peer_address(websocket))
+        return False
+    version = int(version) if version else None
+    session = room.sessions.pop(token, None)
+    if session is None:
+        logger.info("Resume with unknown or expired token from %s", peer_address(websocket))
+        return False
+    
+    old = session.websocket
+    if old is not None:
+        # The old connection has not noticed it is dead yet
+        session.websocket = None
+        cleanup_client(old, broadcast=False)
+        asyncio.create_task(old.close(code=1000, reason="Session resumed elsewhere"))
+    elif session.expiry is not None:
+        session.expiry.cancel()
+        session.expiry = None
+    
+    # Worked out before the client gets its features, so no delta update reaches it first
+    catch_up = room.catch_up(version, session.features)
+    
+    session.token = secrets.token_urlsafe(SESSION_TOKEN_BYTES)
+    session.websocket = websocket
+    room.sessions[session.token] = session
+    client_data.session = session
+    client_data.username = session.username
+    client_data.is_host = session.is_host
+    client_data.features = session.features
+    client_data.buckets = session.buckets
+    username = session.username
+    logger.info("Client %s resumed in room %s from %s", username, room.code, peer_address(websocket))
+    
+    if session.is_host:
+        room.attach_host(websocket)
+    else:
+        room.record("join", username)
+        room.update_presence()
+    
+    place = room.buzz_queue.index(username) + 1 if username in room.buzz_queue else None
+    safe_send(websocket, json.dumps({
+        "type": "resumed", "token": session.token, "username": username,
+        "score": room.player_scores.get(username, 0), "queue_position": place,
+        "resume_window": SESSION_RESUME_WINDOW,
+    }))
+    if catch_up is not None:
+        safe_send(websocket, catch_up)
+    # A client that saw a state flushed after the board last changed already
+    # has the board and every reveal (frames arrive in order)
+    if room.pack is not None and not session.is_host and (version is None or version <= room.board_version):
+        safe_send(websocket, room.board_frame())
+    return True
+
+async def handle_spectator(websocket, room, feed_format):
+    """Serve a read-only spectator: shared game-state frames out, nothing parsed in
+
+    Spectators do not send a username, are not members of room.clients and
+    have no rate limits or heartbeat; a spectator that sends anything is
+    disconnected.
+    """
+    if len(room.spectators) >= MAX_SPECTATORS:
+        logger.warning("Spectator rejected: max spectators (%s) reached in room %s", MAX_SPECTATORS, room.code)
+        await websocket.close(code=1013, reason="Too many spectators")
+        return
+
+    feed = room.spectator_feeds[feed_format]
+    room.spectators[websocket] = None
+    feed.subscribers += 1
+    if feed.subscribers == 1:
+        # The feed was not kept up to date while nobody used it
+        room.publish_spectator_frames()
+    writer = asyncio.create_task(spectator_writer(websocket, feed))
+    try:
+        async for _ in websocket:
+            await websocket.close(code=1008, reason="Spectators are read-only")
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        writer.cancel()
+        feed.subscribers -= 1
+        room.spectators.pop(websocket, None)
+        room.last_active = time.monotonic()
+
+async def spectator_writer(websocket, feed):
+    """Send a spectator each new frame of its feed, skipping any it was too slow for"""
+    version = 0
+    try:
+        while True:
+            if feed.version == version:
+                await feed.changed.wait()
+            version = feed.version
+            await asyncio.wait_for(websocket.send(feed.frame), timeout=SEND_TIMEOUT)
+    except asyncio.TimeoutError:
+        SEND_FAILURES["timeout"].value += 1
+        await websocket.close(code=1013, reason="Client too slow")
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+# Command dispatch: handlers are registered under the message prefix they
+# answer to, "NAME" for bare commands and "NAME:" for commands with an argument,
+# with who may send them. handle_message finds the handler with one lookup.
+HOST_ONLY = 'host'
+PLAYERS_ONLY = 'players'
+COMMANDS: Dict[str, tuple] = {}
+COMMAND_METRICS: Dict[str, tuple] = {}  # prefix -> (message counter, duration histogram)
+
+def command(prefix, allowed=None):
+    """Register a handler(websocket, client_data, arg, message) for a command"""
+    def register(handler):
+        COMMANDS[prefix] = (handler, allowed)
+        COMMAND_METRICS[prefix] = (
+            metrics.get("jeopardy_messages_total", command=prefix.rstrip(':')),
+            metrics.get("jeopardy_command_duration_seconds", command=prefix.rstrip(':')),
+        )
+        return handler
+    return register
+
+def dispatch(websocket, client_data, message):
+    """Run the handler for a text message, or reject it as unknown
+    
+    Commands the sender is not allowed to use are rejected the same way as
+    unknown ones.
+    """
+    colon = message.find(':')
+    prefix = message if colon < 0 else message[:colon + 1]
+    entry = COMMANDS.get(prefix)
+    if entry is not None:
+        handler, allowed = entry
+        if allowed is None or (allowed == HOST_ONLY) == (websocket == client_data.room.host_socket):
+            start = time.perf_counter()
+            handler(websocket, client_data, None if colon < 0 else message[colon + 1:], message)
+            count, duration = COMMAND_METRICS[prefix]
+            count.value += 1
+            duration.observe(time.perf_counter() - start)
+            return
+    
+    UNKNOWN_MESSAGES.value += 1
+    logger.warning("Unknown message from %s: %s", client_data.username, message[:100])
+    safe_send(websocket, json.dumps({"error": "Unknown message type"}))
+
+async def handle_message(websocket, message, username):
+    dispatch(websocket, client_info[websocket], message)
+
+@command("PING")
+def handle_ping(websocket, client_data, arg, message):
+    safe_send(websocket, COMPACT_PONG if 'compact' in client_data.features else "PONG")
+
+@command("BUZZ")
+def handle_buzz(websocket, client_data, arg, message):
+    room = client_data.room
+    username = client_data.username
+    penalty = COMPACT_PENALTY if 'compact' in client_data.features else "PENALTY"
+    
+    # Additional rate limiting for buzz attempts
+    if not check_rate_limit(client_data, 'buzz'):
+        logger.warning("Buzz rate limit exceeded for %s", username)
+        safe_send(websocket, penalty)
+        return
+        
+    if room.buzz_lock and username not in room.buzz_queue:
+        logger.info("%s buzzed in!", username)
+        room.buzz_queue.append(username)
+        room.record("queue_append", username)
+        room.journal("buzz", username)
+        room.update_clients()
+    else:
+        logger.info("%s buzzed in but was denied!", username)
+        safe_send(websocket, penalty)
+
+@command("BOOT", HOST_ONLY)
+def handle_boot(websocket, client_data, arg, message):
+    room = client_data.room
+    if room.buzz_queue:
+        removed_player = room.buzz_queue.pop(0)
+        room.record("queue_remove", removed_player)
+        room.journal("boot")
+        logger.info("Host booted %s", removed_player)
+    room.update_clients()
+
+@command("WIN", HOST_ONLY)
+def handle_win(websocket, client_data, arg, message):
+    room = client_data.room
+    if room.buzz_queue:
+        win_player = room.buzz_queue.pop(0)
+        room.buzz_queue = []
+        room.buzz_lock = False
+        room.record("queue_clear")
+        room.record("lock", False)
+        room.journal("win")
+        logger.info("Host marked %s as winner", win_player)
+        room.update_clients(win_player)
+
+@command("LOCK", HOST_ONLY)
+def handle_lock(websocket, client_data, arg, message):
+    room = client_data.room
+    room.buzz_lock = False
+    room.buzz_queue = []
+    room.record("queue_clear")
+    room.record("lock", False)
+    room.journal("lock")
+    logger.info("Host locked buzzing")
+    room.update_clients()
+
+@command("UNLOCK", HOST_ONLY)
+def handle_unlock(websocket, client_data, arg, message):
+    room = client_data.room
+    room.buzz_lock = True
+    room.record("lock", True)
+    room.journal("unlock")
+    logger.info("Host unlocked buzzing")
+    room.update_clients()
+
+@command("FINAL", HOST_ONLY)
+def handle_final(websocket, client_data, arg, message):
+    logger.info("Host started Final Jeopardy")
+    client_data.room.open_final_phase('answers', FINAL_ANSWER_SECONDS)
+    client_data.room.broadcast_to_clients("FINAL")
+
+@command("WAGER_REQUEST", HOST_ONLY)
+def handle_wager_request(websocket, client_data, arg, message):
+    logger.info("Host requested wagers")
+    room = client_data.room
+    room.cancel_final()  # a new Final Jeopardy round
+    room.open_final_phase('wagers', FINAL_WAGER_SECONDS)
+    room.broadcast_to_clients("WAGER_REQUEST")
+
+@command("FINAL_CLOSE", HOST_ONLY)
+def handle_final_close(websocket, client_data, arg, message):
+    # Stop waiting for the remaining wagers or answers
+    client_data.room.close_final_phase()
+
+@command("FINAL_RESULTS:", HOST_ONLY)
+def handle_final_results(websocket, client_data, arg, message):
+    room = client_data.room
+    if room.final is None or room.final.phase != 'judging':
+        safe_send(websocket, json.dumps({"error": "No Final Jeopardy answers to score"}))
+        return
+    try:
+        verdicts = json.loads(arg)
+        if not isinstance(verdicts, dict) or not all(isinstance(value, bool) for value in verdicts.values()):
+            raise ValueError("expected {\"player\": true|false, ...}")
+    except ValueError as e:
+        logger.warning("Invalid final results from host: %s", e)
+        safe_send(websocket, json.dumps({"error": f"Invalid final results: {e}"}))
+        return
+    room.apply_final_results(verdicts)
+
+@command("RESET_GAME", HOST_ONLY)
+def handle_reset_game(websocket, client_data, arg, message):
+    room = client_data.room
+    logger.info("Host reset the game")
+    # Reset server game state
+    room.cancel_final()
+    room.buzz_lock = False
+    room.buzz_queue = []
+    room.drawing_mode = False
+    room.live_drawing = False
+    room.currently_drawing = []
+    room.drawings.clear()
+    room.clear_strokes()
+    room.revealed.clear()
+    room.revealed_media.clear()
+    # Reset all scores
+    for player in room.player_scores:
+        room.player_scores[player] = 0
+    room.record("queue_clear")
+    room.record("lock", False)
+    if room.scoreboard_enabled:
+        room.record("scores", dict(room.player_scores))
+    room.journal("reset")
+    room.board_changed()
+    room.broadcast_to_clients("RESET_GAME")
+    room.update_clients()
+
+@command("TOGGLE_SCOREBOARD:", HOST_ONLY)
+def handle_toggle_scoreboard(websocket, client_data, arg, message):
+    room = client_data.room
+    enabled = arg.split(":")[0] == "ON"
+    room.scoreboard_enabled = enabled
+    room.record("scoreboard", enabled)
+    if enabled:
+        room.record("scores", dict(room.player_scores))
+    room.journal("scoreboard", enabled)
+    logger.info("Host set scoreboard to %s", enabled)
+    room.update_clients()
+
+@command("SCORE_UPDATE:", HOST_ONLY)
+def handle_score_update(websocket, client_data, arg, message):
+    room = client_data.room
+    try:
+        parts = arg.split(":")
+        if len(parts) >= 2:
+            player_name = parts[0]
+            score_change = int(parts[1])
+            # Scores are journaled and sent as i64; a change the journal cannot record is refused
+            if score_change not in I64_RANGE:
+                raise ValueError("score change out of range")
+            if player_name in room.player_scores and room.player_scores[player_name] + score_change not in I64_RANGE:
+                raise ValueError("score out of range")
+            if player_name in room.player_scores:
+                room.player_scores[player_name] += score_change
+                if room.scoreboard_enabled:
+                    room.record("score", player_name, score_change)
+                room.journal("score", player_name, score_change)
+                logger.info("Host updated %s's score by %s to %s", player_name, score_change, room.player_scores[player_name])
+                room.update_clients()
+            else:
+                logger.warning("Score update for unknown player: %s", player_name)
+    except (ValueError, IndexError) as e:
+        logger.warning("Invalid score update format: %s, error: %s", message, e)
+
+@command("FINAL_ANSWER:", PLAYERS_ONLY)
+def handle_final_answer(websocket, client_data, arg, message):
+    room = client_data.room
+    username = client_data.username
+    # Validate final answer format and length
+    try:
+        parts = arg.split(":", 1)
+        if len(parts) < 2:
+            raise ValueError("Invalid final answer format")
+        
+        answer_username = validate_input(parts[0], MAX_USERNAME_LENGTH, "Answer username")
+        answer_text = validate_input(parts[1], MAX_FINAL_ANSWER_LENGTH, "Final answer")
+        
+        # Verify username matches
+        if answer_username != username:
+            logger.warning("Username mismatch in final answer from %s", username)
+            safe_send(websocket, json.dumps({"error": "Username mismatch"}))
+            return
+        
+        if room.final is None or room.final.phase != 'answers':
+            safe_send(websocket, json.dumps({"error": "Final answers are closed"}))
+            return
+        
+        # Kept for the host until the answers close; a later answer replaces an earlier one
+        room.final.answers[username] = answer_text
+        logger.info("Final answer received from %s: %s...", username, answer_text[:50])
+        room.final_submitted()
+            
+    except ValueError as e:
+        logger.warning("Invalid final answer from %s: %s", username, e)
+        safe_send(websocket, json.dumps({"error": f"Invalid final answer: {e}"}))
+
+@command("WAGER:", PLAYERS_ONLY)
+def handle_wager(websocket, client_data, arg, message):
+    room = client_data.room
+    username = client_data.username
+    # Validate wager format and value
+    try:
+        parts = arg.split(":", 1)
+        if len(parts) < 2:
+            raise ValueError("Invalid wager format")
+        
+        wager_username = validate_input(parts[0], MAX_USERNAME_LENGTH, "Wager username")
+        wager_amount = parts[1].strip()
+        
+        # Verify username matches
+        if wager_username != username:
+            logger.warning("Username mismatch in wager from %s", username)
+            safe_send(websocket, json.dumps({"error": "Username mismatch"}))
+            return
+        
+        # Validate wager amount (can be numeric or text)
+        wager_amount = validate_input(wager_amount, MAX_WAGER_LENGTH, "Wager amount")
+        
+        if room.final is None or room.final.phase != 'wagers':
+            safe_send(websocket, json.dumps({"error": "Wagers are closed"}))
+            return
+        
+        room.final.wagers[username] = wager_amount
+        logger.info("Wager received from %s: $%s", username, wager_amount)
+        room.final_submitted()
+            
+    except ValueError as e:
+        logger.warning("Invalid wager from %s: %s", username, e)
+        safe_send(websocket, json.dumps({"error": f"Invalid wager: {e}"}))
 
-# Host authentication
-host_password = os.environ.get('HOST_PASSWORD', str(uuid.uuid4()))
-logger.info(f"Host password: {host_password}")
+@command("DRAWING_MODE:", HOST_ONLY)
+def handle_drawing_mode(websocket, client_data, arg, message):
+    room = client_data.room
+    mode = arg.split(":")[0]
+    room.drawing_mode = mode in ("ON", "LIVE")
+    room.live_drawing = (mode == "LIVE")
+    if not room.drawing_mode:
+        room.currently_drawing = []  # Clear the list when drawing mode ends
+        room.drawings.clear()
+    if not room.live_drawing:
+        room.clear_strokes()
+    room.journal("drawing_mode", mode if room.drawing_mode else "OFF")
+    logger.info("Host set drawing mode to %s", mode if room.drawing_mode else 'OFF')
+    room.broadcast_to_clients(f"DRAWING_MODE:{mode if room.drawing_mode else 'OFF'}")
 
-# Scorekeeping
-player_scores: Dict[str, int] = {}
-scoreboard_enabled = False
+@command("CLEAR_DRAWINGS", HOST_ONLY)
+def handle_clear_drawings(websocket, client_data, arg, message):
+    room = client_data.room
+    logger.info("Host clearing all drawings")
+    room.drawings.clear()
+    room.clear_strokes()
+    room.broadcast_to_clients("CLEAR_DRAWINGS")
 
-# Heartbeat configuration
-HEARTBEAT_INTERVAL = 30  # seconds
-HEARTBEAT_TIMEOUT = 90   # seconds - Increased to be more tolerant of inactive tabs
+@command("STROKES:", PLAYERS_ONLY)
+def handle_strokes(websocket, client_data, arg, message):
+    room = client_data.room
+    username = client_data.username
+    if not room.live_drawing:
+        safe_send(websocket, json.dumps({"error": "Live drawing is not active"}))
+        return
+    
+    if len(message) > MAX_STROKES_MESSAGE:
+        logger.warning("Stroke batch from %s too large: %s chars", username, len(message))
+        safe_send(websocket, json.dumps({"error": "Stroke batch is too large"}))
+        return
+    
+    try:
+        segments = parse_strokes(arg)
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning("Invalid stroke batch from %s: %s", username, e)
+        safe_send(websocket, json.dumps({"error": f"Invalid strokes: {e}"}))
+        return
+    
+    if not room.add_strokes(username, segments):
+        logger.warning("Stroke log full for %s", username)
+        safe_send(websocket, json.dumps({"error": "Drawing has too many points"}))
 
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 60   # seconds
-RATE_LIMIT_MAX_MESSAGES = 100  # messages per window
-RATE_LIMIT_BUZZ_WINDOW = 5   # seconds  
-RATE_LIMIT_MAX_BUZZ = 3      # buzz attempts per window
+@command("STROKES_CLEAR", PLAYERS_ONLY)
+def handle_strokes_clear(websocket, client_data, arg, message):
+    if client_data.room.live_drawing:
+        client_data.room.clear_strokes(client_data.username)
 
-# Security configuration
-MAX_USERNAME_LENGTH = 50
-MAX_MESSAGE_LENGTH = 500000  # Increased to accommodate drawing submissions
-MAX_CLIENTS = 50
-MAX_FINAL_ANSWER_LENGTH = 500
-MAX_DRAWING_SIZE = 500000  # 500KB limit for drawing data
+@command("STROKE_REPLAY")
+def handle_stroke_replay(websocket, client_data, arg, message):
+    room = client_data.room
+    # The host gets every player's strokes, a player their own (to redraw after reconnecting)
+    safe_send(websocket, room.stroke_replay(None if websocket == room.host_socket else client_data.username))
 
-def validate_input(text: str, max_length: int, field_name: str) -> str:
-    """Validate and sanitize input text"""
-    if not isinstance(text, str):
-        raise ValueError(f"{field_name} must be a string")
+@command("DRAWING_SUBMIT:", PLAYERS_ONLY)
+def handle_drawing_submit(websocket, client_data, arg, message):
+    room = client_data.room
+    username = client_data.username
+    if not room.drawing_mode:
+        logger.warning("Drawing submission from %s rejected - drawing mode is off", username)
+        safe_send(websocket, json.dumps({"error": "Drawing mode is not active"}))
+        return
     
-    # Remove control characters and excessive whitespace
-    sanitized = ''.join(char for char in text if ord(char) >= 32 or char in '\n\r\t')
-    sanitized = ' '.join(sanitized.split())  # Normalize whitespace
+    if not check_rate_limit(client_data, 'drawing'):
+        logger.warning("Drawing rate limit exceeded for %s", username)
+        safe_send(websocket, json.dumps({"error": "Too many drawing submissions"}))
+        return
+        
+    # Validate drawing submission size
+    if len(message) > MAX_DRAWING_SIZE:
+        logger.warning("Drawing submission from %s too large: %s bytes", username, len(message))
+        safe_send(websocket, json.dumps({"error": "Drawing is too large"}))
+        return
+        
+    try:
+        # Parse and validate drawing data
+        drawing_data = json.loads(arg)
+        
+        # Validate required fields
+        if not all(key in drawing_data for key in ['username', 'timestamp', 'imageData']):
+            raise ValueError("Missing required fields in drawing submission")
+        
+        # Verify username matches
+        if drawing_data['username'] != username:
+            logger.warning("Username mismatch in drawing from %s", username)
+            safe_send(websocket, json.dumps({"error": "Username mismatch"}))
+            return
+        
+        if not isinstance(drawing_data['imageData'], str):
+            raise ValueError("imageData must be a string")
+        if not is_finite_number(drawing_data['timestamp']):
+            raise ValueError("timestamp must be a finite number")
+        
+        # Forward to host and all other clients
+        if room.host_socket:
+            # Keep the image once; clients that opted in get only a reference
+            digest = store_text_drawing(drawing_data['imageData'])
+            room.drawings.add(digest)
+            reference = {
+                "hash": digest,
+                "username": username,
+                "timestamp": drawing_data['timestamp'],
+                "size": len(drawing_data['imageData'])
+            }
+            thumbnail = drawing_data.get('thumbnail')
+            if isinstance(thumbnail, str) and len(thumbnail) <= MAX_THUMBNAIL_SIZE:
+                reference["thumbnail"] = thumbnail
+            room.relay_drawing("DRAWING_REF:" + json.dumps(reference), message)
+            logger.info("Drawing received from %s, broadcasting to all clients", username)
+        else:
+            logger.warning("Drawing from %s but no host connected", username)
+            
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning("Invalid drawing submission from %s: %s", username, e)
+        safe_send(websocket, json.dumps({"error": f"Invalid drawing: {e}"}))
+
+@command("DRAWING_FETCH:")
+def handle_drawing_fetch(websocket, client_data, arg, message):
+    # Only drawings from this room's current round can be fetched
+    frame = drawing_frame(arg, 'binary' in client_data.features) if arg in client_data.room.drawings else None
+    if frame is None:
+        safe_send(websocket, json.dumps({"error": "Drawing not available"}))
+    else:
+        safe_send(websocket, frame)
+
+@command("LOAD_PACK:", HOST_ONLY)
+def handle_load_pack(websocket, client_data, arg, message):
+    if not PACK_NAME_PATTERN.match(arg):
+        safe_send(websocket, json.dumps({"error": "Invalid pack name"}))
+        return
+    asyncio.create_task(load_pack_into_room(client_data.room, websocket, arg))
+
+async def load_pack_into_room(room, websocket, name):
+    """Load a game pack off the event loop and send everyone the new board"""
+    try:
+        pack = await asyncio.get_running_loop().run_in_executor(None, load_pack, name)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load pack %s for room %s: %s", name, room.code, e)
+        safe_send(websocket, json.dumps({"error": f"Could not load pack: {e}"}))
+        return
+    if rooms.get(room.code) is not room:
+        return
+    room.pack = pack
+    room.revealed = set()
+    room.revealed_media = set()
+    room.board_changed()
+    logger.info("Loaded pack %s into room %s: %s clues, %s media files",
+                name, room.code, len(pack.clues), len(pack.media_paths))
+    if room.host_socket is not None:
+        safe_send(room.host_socket, pack.board(room.revealed, True))
+    room.broadcast_to_clients(room.board_frame())
+
+@command("CLUE:", HOST_ONLY)
+def handle_clue(websocket, client_data, arg, message):
+    room = client_data.room
+    pack = room.pack
+    clue_id = int(arg) if arg.isdecimal() else -1
+    if pack is None or not 0 <= clue_id < len(pack.clues):
+        safe_send(websocket, json.dumps({"error": "Unknown clue"}))
+        return
+    room.revealed.add(clue_id)
+    if pack.clue_media[clue_id] >= 0:
+        room.revealed_media.add(pack.clue_media[clue_id])
+    room.board_changed()
+    logger.info("Host revealed clue %s in room %s", clue_id, room.code)
+    # Players already have the board, so the reveal names the clue by id and
+    # leaves its media to MEDIA_FETCH
+    room.broadcast_to_clients(pack.clue_frame(clue_id))
+
+@command("MEDIA_FETCH:")
+def handle_media_fetch(websocket, client_data, arg, message):
+    room = client_data.room
+    pack = room.pack
+    media_id = int(arg) if arg.isdecimal() else -1
+    # Players only get the media of clues already revealed
+    if (pack is None or not 0 <= media_id < len(pack.media_paths)
+            or not (client_data.is_host or media_id in room.revealed_media)):
+        safe_send(websocket, json.dumps({"error": "Media not available"}))
+        return
+    binary = 'binary' in client_data.features
+    frame = media_store.get((pack.digest, pack.name, media_id, binary))
+    if frame is not None:
+        safe_send(websocket, frame)
+    else:
+        asyncio.create_task(send_media(websocket, pack, media_id, binary))
+
+async def send_media(websocket, pack, media_id, binary):
+    """Read a media file off the event loop, keep its frame in media_store and send it
     
-    if len(sanitized) > max_length:
-        raise ValueError(f"{field_name} exceeds maximum length of {max_length}")
+    Everyone fetching the same file meanwhile (as the whole room does when a
+    clue is revealed) waits for the one read.
+    """
+    key = (pack.digest, pack.name, media_id)
+    loading = media_loads.get(key)
+    if loading is None:
+        loading = media_loads[key] = asyncio.get_running_loop().run_in_executor(None, pack.read_media, media_id)
+        loading.add_done_callback(lambda _: media_loads.pop(key, None))
+    try:
+        data = await loading
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read media %s of pack %s: %s", media_id, pack.name, e)
+        safe_send(websocket, json.dumps({"error": "Media not available"}))
+        return
+    frame = media_store.get((*key, binary))
+    if frame is None:
+        frame = media_frame(pack, media_id, data, binary)
+        media_store.put((*key, binary), frame)
+    safe_send(websocket, frame)
+
+@command("FEATURES:")
+def handle_features(websocket, client_data, arg, message):
+    room = client_data.room
+    features = {name for name in arg.split(",") if name in SUPPORTED_FEATURES}
+    # Anything still pending goes out in the client's old format first
+    room.flush_pending()
+    client_data.features = features
+    logger.info("%s enabled features: %s", client_data.username, sorted(features) or 'none')
+    safe_send(websocket, json.dumps({"features": sorted(features)}))
+    if 'delta' in features:
+        safe_send(websocket, room.build_snapshot())
+
+@command("SNAPSHOT")
+def handle_snapshot(websocket, client_data, arg, message):
+    # Sent by delta clients that detected a version gap
+    client_data.room.flush_pending()
+    safe_send(websocket, client_data.room.build_snapshot())
+
+@command("QUEUE_STATS", HOST_ONLY)
+def handle_queue_stats(websocket, client_data, arg, message):
+    safe_send(websocket, json.dumps({"queue_stats": outbox_stats(client_data.room.clients)}))
+
+@command("CLOSE_ROOM", HOST_ONLY)
+def handle_close_room(websocket, client_data, arg, message):
+    logger.info("Host closed room %s", client_data.room.code)
+    close_room(client_data.room)
+
+BINARY_DRAWING_METRICS = (
+    metrics.get("jeopardy_messages_total", command="BINARY_DRAWING_SUBMIT"),
+    metrics.get("jeopardy_command_duration_seconds", command="BINARY_DRAWING_SUBMIT"),
+)
+
+async def handle_binary_message(websocket, data, username):
+    """Handle a binary frame: a compact command or a binary drawing submission"""
+    client_data = client_info[websocket]
     
-    if not sanitized.strip():
-        raise ValueError(f"{field_name} cannot be empty")
+    # One-byte compact commands share the text commands' handlers
+    if len(data) == 1 and data[0] in COMPACT_COMMANDS:
+        dispatch(websocket, client_data, COMPACT_COMMANDS[data[0]])
+        return
+    
+    view = memoryview(data)
+    if len(view) < BINARY_HEADER.size or view[0] != BINARY_DRAWING_SUBMIT or websocket == client_data.room.host_socket:
+        UNKNOWN_MESSAGES.value += 1
+        logger.warning("Unknown binary message from %s: %s bytes", username, len(view))
+        safe_send(websocket, json.dumps({"error": "Unknown message type"}))
+        return
     
-    return sanitized.strip()
+    start = time.perf_counter()
+    handle_binary_drawing(websocket, client_data, data, view, username)
+    count, duration = BINARY_DRAWING_METRICS
+    count.value += 1
+    duration.observe(time.perf_counter() - start)
 
-def check_rate_limit(client_data: dict, limit_type: str = 'general') -> bool:
-    """Check if client is within rate limits"""
-    current_time = time.time()
+def handle_binary_drawing(websocket, client_data, data, view, username):
+    """Handle a drawing frame: [type][username length][timestamp][username][payload]
     
-    if limit_type == 'general':
-        window = RATE_LIMIT_WINDOW
-        max_messages = RATE_LIMIT_MAX_MESSAGES
-        messages_key = 'message_timestamps'
-    elif limit_type == 'buzz':
-        window = RATE_LIMIT_BUZZ_WINDOW
-        max_messages = RATE_LIMIT_MAX_BUZZ
-        messages_key = 'buzz_timestamps'
-    else:
-        return True
+    Only the fixed header is unpacked; the username and image are checked
+    and forwarded as slices of the received buffer, never parsed or copied.
+    """
+    room = client_data.room
+    if not room.drawing_mode:
+        logger.warning("Drawing submission from %s rejected - drawing mode is off", username)
+        safe_send(websocket, json.dumps({"error": "Drawing mode is not active"}))
+        return
     
-    if messages_key not in client_data:
-        client_data[messages_key] = []
+    if not check_rate_limit(client_data, 'drawing'):
+        logger.warning("Drawing rate limit exceeded for %s", username)
+        safe_send(websocket, json.dumps({"error": "Too many drawing submissions"}))
+        return
     
-    # Clean old timestamps
-    client_data[messages_key] = [
-        ts for ts in client_data[messages_key] 
-        if current_time - ts < window
-    ]
+    # Validate drawing submission size
+    if len(view) > MAX_DRAWING_SIZE:
+        logger.warning("Drawing submission from %s too large: %s bytes", username, len(view))
+        safe_send(websocket, json.dumps({"error": "Drawing is too large"}))
+        return
     
-    # Check if limit exceeded
-    if len(client_data[messages_key]) >= max_messages:
-        return False
+    _, name_length, timestamp = BINARY_HEADER.unpack_from(view)
+    image_start = BINARY_HEADER.size + name_length
+    if not math.isfinite(timestamp):
+        # NaN or infinity would make the relayed JSON unparseable
+        logger.warning("Invalid drawing submission from %s: timestamp is not finite", username)
+        safe_send(websocket, json.dumps({"error": "Invalid drawing: invalid timestamp"}))
+        return
     
-    # Add current timestamp
-    client_data[messages_key].append(current_time)
-    return True
-
-async def handle_client(websocket):
-    global buzz_lock, buzz_queue, host_socket
+    # Verify username matches
+    if view[BINARY_HEADER.size:image_start] != username.encode():
+        logger.warning("Username mismatch in drawing from %s", username)
+        safe_send(websocket, json.dumps({"error": "Username mismatch"}))
+        return
     
-    # Check connection limit
-    if len(clients) >= MAX_CLIENTS:
-        logger.warning(f"Connection rejected: max clients ({MAX_CLIENTS}) reached")
-        await websocket.close(code=1013, reason="Server full")
+    image = view[image_start:]
+    mime_type = image_mime_type(image)
+    if mime_type is None:
+        logger.warning("Invalid drawing submission from %s: not a PNG, JPEG or WebP image", username)
+        safe_send(websocket, json.dumps({"error": "Invalid drawing: unsupported image format"}))
         return
     
-    client_data = {
-        'username': None,
-        'last_heartbeat': time.time(),
-        'is_host': False,
-        'message_timestamps': [],
-        'buzz_timestamps': []
-    }
-    client_info[websocket] = client_data
-    clients.add(websocket)
+    if not room.host_socket:
+        logger.warning("Drawing from %s but no host connected", username)
+        return
     
-    try:
-        # Wait for username with timeout
-        raw_username = await asyncio.wait_for(websocket.recv(), timeout=30.0)
-        
-        # Validate and sanitize username
-        try:
-            username = validate_input(raw_username, MAX_USERNAME_LENGTH, "Username")
-        except ValueError as e:
-            logger.warning(f"Invalid username from {websocket.remote_address}: {e}")
-            await websocket.close(code=1008, reason=str(e))
-            return
-        
-        # Check if this is a host connection with password
-        if username.startswith("host:"):
-            parts = username.split(":", 1)
-            if len(parts) == 2 and parts[1] == host_password:
-                username = "host"
-                client_data['is_host'] = True
-                logger.info(f"Host authenticated from {websocket.remote_address}")
-            else:
-                logger.warning(f"Invalid host password attempt from {websocket.remote_address}")
-                await websocket.close(code=1008, reason="Invalid host password")
-                return
-        else:
-            client_data['is_host'] = False
-            # Initialize score for new players
-            if username not in player_scores:
-                player_scores[username] = 0
-        
-        client_data['username'] = username
-        logger.info(f"Client {username} connected from {websocket.remote_address}")
-
-        if client_data['is_host']:
-            if host_socket is not None:
-                logger.warning(f"New host connection replacing existing host")
-            host_socket = websocket
-
-        # Send initial state to all clients (including new one)
-        await update_clients()
+    digest = store_binary_drawing(image)
+    room.drawings.add(digest)
+    reference = {"hash": digest, "username": username, "timestamp": timestamp, "size": len(image)}
+    
+    def text_frame():
+        # Older clients get the drawing in the text DRAWING_SUBMIT format
+        return "DRAWING_SUBMIT:" + json.dumps({
+            "username": username,
+            "timestamp": timestamp,
+            "imageData": f"data:{mime_type};base64,{base64.b64encode(image).decode()}"
+        })
+    
+    room.relay_drawing("DRAWING_REF:" + json.dumps(reference), text_frame, binary_frame=data)
+    logger.info("Binary drawing received from %s, broadcasting to all clients", username)
 
-        async for raw_message in websocket:
-            client_data['last_heartbeat'] = time.time()
-            
-            # Validate message length
-            if len(raw_message) > MAX_MESSAGE_LENGTH:
-                logger.warning(f"Message too long from {username}: {len(raw_message)} chars")
-                await safe_send(websocket, json.dumps({"error": "Message too long"}))
-                continue
-            
-            # Check general rate limit
-            if not check_rate_limit(client_data, 'general'):
-                logger.warning(f"Rate limit exceeded for {username}")
-                await safe_send(websocket, json.dumps({"error": "Rate limit exceeded"}))
-                continue
-            
-            try:
-                await handle_message(websocket, raw_message, username)
-            except Exception as e:
-                logger.error(f"Error handling message from {username}: {e}")
-                await safe_send(websocket, json.dumps({"error": "Message processing failed"}))
-                
-    except asyncio.TimeoutError:
-        logger.warning(f"Client connection timed out during setup")
-    except websockets.exceptions.ConnectionClosed:
-        logger.info(f"Client {client_data.get('username', 'unknown')} disconnected")
-    except Exception as e:
-        logger.error(f"Unexpected error in handle_client: {e}")
-    finally:
-        await cleanup_client(websocket)
+def cleanup_client(websocket, broadcast=True):
+    """Clean up client connection and update its room's game state
 
-async def handle_message(websocket, message, username):
-    global buzz_lock, buzz_queue, host_socket, drawing_mode, currently_drawing, scoreboard_enabled, player_scores
+    Returns True if a player (not the host) was removed. Pass broadcast=False
+    when removing several clients at once and send a single update afterwards.
+    """
+    client_data = client_info.pop(websocket, None)
+    if client_data is None:
+        return False
     
-    client_data = client_info.get(websocket, {})
+    room = client_data.room
+    username = client_data.username
+    is_host = client_data.is_host
     
-    if message == "PING":
-        await safe_send(websocket, "PONG")
-        return
+    # A session keeps the player's buzz-queue place: until it expires if this
+    # connection dropped, or for the new connection if it was resumed elsewhere
+    session = client_data.session
+    if session is not None:
+        session.features = client_data.features
+        session.buckets = client_data.buckets
+        if session.websocket is websocket:
+            room.hold_session(session)
     
-    if message == "BUZZ":
-        # Additional rate limiting for buzz attempts
-        if not check_rate_limit(client_data, 'buzz'):
-            logger.warning(f"Buzz rate limit exceeded for {username}")
-            await safe_send(websocket, "PENALTY")
-            return
-            
-        if buzz_lock and username not in buzz_queue:
-            logger.info(f"{username} buzzed in!")
-            buzz_queue.append(username)
-            await update_clients()
-        else:
-            logger.info(f"{username} buzzed in but was denied!")
-            await safe_send(websocket, "PENALTY")
-
-    elif message == "BOOT" and websocket == host_socket:
-        if buzz_queue:
-            removed_player = buzz_queue.pop(0)
-            logger.info(f"Host booted {removed_player}")
-        await update_clients()
-
-    elif message == "WIN" and websocket == host_socket:
-        if buzz_queue:
-            win_player = buzz_queue.pop(0)
-            buzz_queue = []
-            buzz_lock = False
-            logger.info(f"Host marked {win_player} as winner")
-            await update_clients(win_player)
-
-    elif message == "LOCK" and websocket == host_socket:
-        buzz_lock = False
-        buzz_queue = []
-        logger.info("Host locked buzzing")
-        await update_clients()
-        
-    elif message == "UNLOCK" and websocket == host_socket:
-        buzz_lock = True
-        logger.info("Host unlocked buzzing")
-        await update_clients()
-        
-    elif message == "FINAL" and websocket == host_socket:
-        logger.info("Host started Final Jeopardy")
-        await broadcast_to_clients("FINAL")
-        
-    elif message == "WAGER_REQUEST" and websocket == host_socket:
-        logger.info("Host requested wagers")
-        await broadcast_to_clients("WAGER_REQUEST")
-        
-    elif message == "RESET_GAME" and websocket == host_socket:
-        logger.info("Host reset the game")
-        # Reset server game state
-        buzz_lock = False
-        buzz_queue = []
-        drawing_mode = False
-        currently_drawing = []
-        # Reset all scores
-        for player in player_scores:
-            player_scores[player] = 0
-        await broadcast_to_clients("RESET_GAME")
-        await update_clients()
-    
-    elif message.startswith("TOGGLE_SCOREBOARD:") and websocket == host_socket:
-        enabled = message.split(":")[1] == "ON"
-        scoreboard_enabled = enabled
-        logger.info(f"Host set scoreboard to {enabled}")
-        await update_clients()
-    
-    elif message.startswith("SCORE_UPDATE:") and websocket == host_socket:
-        try:
-            parts = message.split(":")
-            if len(parts) >= 3:
-                player_name = parts[1]
-                score_change = int(parts[2])
-                if player_name in player_scores:
-                    player_scores[player_name] += score_change
-                    logger.info(f"Host updated {player_name}'s score by {score_change} to {player_scores[player_name]}")
-                    await update_clients()
-                else:
-                    logger.warning(f"Score update for unknown player: {player_name}")
-        except (ValueError, IndexError) as e:
-            logger.warning(f"Invalid score update format: {message}, error: {e}")
-        
-    elif message.startswith("FINAL_ANSWER:") and websocket != host_socket:
-        # Validate final answer format and length
-        try:
-            parts = message.split(":", 2)
-            if len(parts) < 3:
-                raise ValueError("Invalid final answer format")
-            
-            answer_username = validate_input(parts[1], MAX_USERNAME_LENGTH, "Answer username")
-            answer_text = validate_input(parts[2], MAX_FINAL_ANSWER_LENGTH, "Final answer")
-            
-            # Verify username matches
-            if answer_username != username:
-                logger.warning(f"Username mismatch in final answer from {username}")
-                await safe_send(websocket, json.dumps({"error": "Username mismatch"}))
-                return
-            
-            formatted_message = f"FINAL_ANSWER:{answer_username}:{answer_text}"
-            logger.info(f"Final answer received from {username}: {answer_text[:50]}...")
-            
-            if host_socket:
-                await safe_send(host_socket, formatted_message)
-                
-        except ValueError as e:
-            logger.warning(f"Invalid final answer from {username}: {e}")
-            await safe_send(websocket, json.dumps({"error": f"Invalid final answer: {e}"}))
+    # Remove from buzz queue if present
+    was_in_queue = session is None and username in room.buzz_queue
+    if was_in_queue:
+        room.buzz_queue.remove(username)
+        room.record("queue_remove", username)
+        room.journal("leave_queue", username)
+        logger.info("Removed %s from buzz queue due to disconnect", username)
     
-    elif message.startswith("WAGER:") and websocket != host_socket:
-        # Validate wager format and value
-        try:
-            parts = message.split(":", 2)
-            if len(parts) < 3:
-                raise ValueError("Invalid wager format")
-            
-            wager_username = validate_input(parts[1], MAX_USERNAME_LENGTH, "Wager username")
-            wager_amount = parts[2].strip()
-            
-            # Verify username matches
-            if wager_username != username:
-                logger.warning(f"Username mismatch in wager from {username}")
-                await safe_send(websocket, json.dumps({"error": "Username mismatch"}))
-                return
-            
-            # Validate wager amount (can be numeric or text)
-            wager_amount = validate_input(wager_amount, 50, "Wager amount")
-            
-            formatted_message = f"WAGER:{wager_username}:{wager_amount}"
-            logger.info(f"Wager received from {username}: ${wager_amount}")
-            
-            if host_socket:
-                await safe_send(host_socket, formatted_message)
-                
-        except ValueError as e:
-            logger.warning(f"Invalid wager from {username}: {e}")
-            await safe_send(websocket, json.dumps({"error": f"Invalid wager: {e}"}))
-    
-    elif message.startswith("DRAWING_MODE:") and websocket == host_socket:
-        mode = message.split(":")[1]
-        drawing_mode = (mode == "ON")
-        if not drawing_mode:
-            currently_drawing = []  # Clear the list when drawing mode ends
-        logger.info(f"Host set drawing mode to {drawing_mode}")
-        await broadcast_to_clients(f"DRAWING_MODE:{'ON' if drawing_mode else 'OFF'}")
-    
-    elif message == "CLEAR_DRAWINGS" and websocket == host_socket:
-        logger.info("Host clearing all drawings")
-        await broadcast_to_clients("CLEAR_DRAWINGS")
-        
-    elif message.startswith("DRAWING_SUBMIT:") and websocket != host_socket:
-        if not drawing_mode:
-            logger.warning(f"Drawing submission from {username} rejected - drawing mode is off")
-            await safe_send(websocket, json.dumps({"error": "Drawing mode is not active"}))
-            return
-            
-        # Validate drawing submission size
-        if len(message) > MAX_DRAWING_SIZE:
-            logger.warning(f"Drawing submission from {username} too large: {len(message)} bytes")
-            await safe_send(websocket, json.dumps({"error": "Drawing is too large"}))
-            return
-            
-        try:
-            # Parse and validate drawing data
-            drawing_json = message[15:]  # Remove "DRAWING_SUBMIT:"
-            drawing_data = json.loads(drawing_json)
-            
-            # Validate required fields
-            if not all(key in drawing_data for key in ['username', 'timestamp', 'imageData']):
-                raise ValueError("Missing required fields in drawing submission")
-            
-            # Verify username matches
-            if drawing_data['username'] != username:
-                logger.warning(f"Username mismatch in drawing from {username}")
-                await safe_send(websocket, json.dumps({"error": "Username mismatch"}))
-                return
-            
-            # Forward to host and all other clients
-            if host_socket:
-                await safe_send(host_socket, message)
-                # Broadcast to all non-host clients
-                await broadcast_to_clients(message)
-                logger.info(f"Drawing received from {username}, broadcasting to all clients")
-            else:
-                logger.warning(f"Drawing from {username} but no host connected")
-                
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.warning(f"Invalid drawing submission from {username}: {e}")
-            await safe_send(websocket, json.dumps({"error": f"Invalid drawing: {e}"}))
+    # Remove from currently drawing list if present
+    if username in room.currently_drawing:
+        room.currently_drawing.remove(username)
+        logger.info("Removed %s from currently drawing list due to disconnect", username)
     
+    # Clear host socket if host disconnected
+    if is_host and websocket == room.host_socket:
+        room.host_socket = None
+        logger.warning("Host disconnected from room %s", room.code)
     else:
-        logger.warning(f"Unknown message from {username}: {message[:100]}")
-        await safe_send(websocket, json.dumps({"error": "Unknown message type"}))
-
-async def cleanup_client(websocket):
-    """Clean up client connection and update game state"""
-    global host_socket, currently_drawing, player_scores
-    
-    if websocket in client_info:
-        username = client_info[websocket].get('username', 'unknown')
-        is_host = client_info[websocket].get('is_host', False)
-        
-        # Remove from buzz queue if present
-        was_in_queue = username in buzz_queue
-        if was_in_queue:
-            buzz_queue.remove(username)
-            logger.info(f"Removed {username} from buzz queue due to disconnect")
-        
-        # Remove from currently drawing list if present
-        if username in currently_drawing:
-            currently_drawing.remove(username)
-            logger.info(f"Removed {username} from currently drawing list due to disconnect")
-        
-        # Clear host socket if host disconnected
-        if is_host and websocket == host_socket:
-            host_socket = None
-            logger.warning("Host disconnected")
-        else:
-            # Keep player score even if disconnected (they might reconnect)
-            # Score will persist until game reset
-            logger.info(f"Player {username} disconnected, score preserved: {player_scores.get(username, 0)}")
-        
-        del client_info[websocket]
-        
-        # Update all clients with new connected players list
-        if not is_host:  # Only update if a non-host player disconnected
-            await update_clients()
+        # Keep player score even if disconnected (they might reconnect)
+        # Score will persist until game reset
+        logger.info("Player %s disconnected, score preserved: %s", username, room.player_scores.get(username, 0))
     
-    clients.discard(websocket)
+    if username and not is_host:
+        room.record("leave", username)
+    
+    client_data.writer.cancel()
+    room.clients.pop(websocket, None)
+    room.last_active = time.monotonic()
+    
+    # Update all clients with new connected players list
+    removed_player = not is_host
+    if removed_player and broadcast:  # Only update if a non-host player disconnected
+        room.update_presence()
+    return removed_player
 
-async def safe_send(websocket, message):
-    """Safely send message to websocket with error handling"""
-    try:
-        await websocket.send(message)
+def safe_send(websocket, message, snapshot=False):
+    """Queue a message for one client without waiting on its socket
+    
+    Returns False if the client is gone or its outbox overflowed, in which
+    case the client is detached; its handler then cleans up as it exits.
+    """
+    client_data = client_info.get(websocket)
+    if client_data is None:
+        SEND_FAILURES["closed"].value += 1
+        logger.debug("Attempted to send to closed connection")
+        return False
+    
+    outbox = client_data.outbox
+    if outbox.put(message, snapshot):
         return True
+    
+    SEND_FAILURES["overflow"].value += 1
+    if not outbox.detached:
+        outbox.detached = True
+        logger.warning("Outbox overflow for %s (%s frames, %s bytes queued), detaching",
+                       client_data.username, outbox.depth(), outbox.size)
+        asyncio.create_task(websocket.close(code=1013, reason="Client too slow"))
+    return False
+
+async def client_writer(websocket, outbox):
+    """Drain one client's outbox onto its socket
+    
+    Each connection has its own writer, so a slow socket only ever delays
+    itself. A client that does not accept a frame within SEND_TIMEOUT is closed.
+    """
+    try:
+        while True:
+            frame = await outbox.get()
+            await asyncio.wait_for(websocket.send(frame), timeout=SEND_TIMEOUT)
+            outbox.sent += 1
+    except asyncio.TimeoutError:
+        SEND_FAILURES["timeout"].value += 1
+        username = client_info[websocket].username if websocket in client_info else 'unknown'
+        logger.warning("Client %s did not accept a frame within %ss, detaching", username, SEND_TIMEOUT)
+        outbox.detached = True
+        await websocket.close(code=1013, reason="Client too slow")
     except websockets.exceptions.ConnectionClosed:
-        logger.debug(f"Attempted to send to closed connection")
-        await cleanup_client(websocket)
-        return False
+        pass
     except Exception as e:
-        logger.error(f"Error sending message: {e}")
-        return False
+        SEND_FAILURES["error"].value += 1
+        logger.error("Error sending message: %s", e)
+        await websocket.close(code=1011, reason="Send failed")
+
+def fan_out(targets, message, snapshot=False):
+    """Queue one pre-encoded frame for every target"""
+    for client in targets:
+        safe_send(client, message, snapshot)
 
-async def update_clients(win_player=None):
-    """Update all clients with current game state"""
-    global scoreboard_enabled, player_scores
+class SharedDeflate(PerMessageDeflate):
+    """permessage-deflate that compresses each distinct frame once
     
-    if not clients:
-        return
+    Only text frames of COMPRESSION_MIN_SIZE bytes or more are compressed:
+    small JSON gains little, and binary frames (images, compact and zlib
+    spectator frames) are compact already. Without context takeover a
+    compressed frame depends only on its bytes and the window size, so a
+    broadcast is compressed for the first socket and reused from
+    compressed_frames for the rest, and no compressor outlives a frame.
+    """
     
-    # Get list of connected non-host players
-    connected_names = [info['username'] for info in client_info.values() if info['username'] and not info['is_host']]
+    def encode(self, frame):
+        if frame.opcode not in (Opcode.TEXT, Opcode.BINARY, Opcode.CONT):
+            return frame
+        if frame.opcode is not Opcode.TEXT or not frame.fin or len(frame.data) < COMPRESSION_MIN_SIZE:
+            COMPRESSION_FRAMES["skipped"].value += 1
+            return frame
+        
+        key = (self.local_max_window_bits, hashlib.sha256(frame.data).digest())
+        data = compressed_frames.get(key)
+        if data is None:
+            start = time.perf_counter()
+            encoder = zlib.compressobj(wbits=-self.local_max_window_bits, **self.compress_settings)
+            # Drop the empty block the sync flush ends with, as RFC 7692 requires
+            data = (encoder.compress(frame.data) + encoder.flush(zlib.Z_SYNC_FLUSH))[:-4]
+            COMPRESSION_TIME.value += time.perf_counter() - start
+            compressed_frames.put(key, data)
+            COMPRESSION_FRAMES["compressed"].value += 1
+        else:
+            COMPRESSION_FRAMES["shared"].value += 1
+        COMPRESSION_BYTES["raw"].value += len(frame.data)
+        COMPRESSION_BYTES["compressed"].value += len(data)
+        return dataclasses.replace(frame, data=data, rsv1=True)
+
+class SharedDeflateFactory(ServerPerMessageDeflateFactory):
+    """Negotiates permessage-deflate as usual and hands out SharedDeflate"""
     
-    # Build game state message
-    game_state = {
-        "queue": buzz_queue,
-        "win_player": win_player,
-        "connected_players": connected_names,
-        "buzz_lock": buzz_lock,
-        "scoreboard_enabled": scoreboard_enabled
-    }
+    def process_request_params(self, params, accepted_extensions):
+        response, extension = super().process_request_params(params, accepted_extensions)
+        return response, SharedDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+        )
+
+def compression_extensions():
+    """Extension factories for websockets.serve under the compression settings
     
-    # Include scores if scoreboard is enabled
-    if scoreboard_enabled:
-        game_state["scores"] = player_scores
+    Neither side keeps context between messages, so an idle connection holds
+    no zlib state, and the window bounds what any one message needs.
+    """
+    if not COMPRESSION_ENABLED:
+        return []
+    return [SharedDeflateFactory(
+        server_no_context_takeover=True,
+        client_no_context_takeover=True,
+        server_max_window_bits=COMPRESSION_WINDOW_BITS,
+        client_max_window_bits=COMPRESSION_WINDOW_BITS,
+        compress_settings={"level": COMPRESSION_LEVEL, "memLevel": COMPRESSION_MEM_LEVEL},
+    )]
+
+def outbox_stats(targets=None):
+    """Per-client outbox depth and drop counters, most backed-up first"""
+    if targets is None:
+        targets = client_info
+
+    stats = [
+        {
+            "username": info.username,
+            "depth": info.outbox.depth(),
+            "bytes": info.outbox.size,
+            "sent": info.outbox.sent,
+            "coalesced": info.outbox.coalesced,
+            "dropped": info.outbox.dropped,
+        }
+        for info in (client_info[client] for client in targets)
+    ]
+    stats.sort(key=lambda entry: (entry['depth'], entry['bytes']), reverse=True)
+    return stats
+
+def expire_stale_clients(now) -> int:
+    """Disconnect clients not heard from for HEARTBEAT_TIMEOUT
     
-    message = json.dumps(game_state)
-    failed_clients = []
+    Stale clients are removed together, with one update per affected room.
+    Returns the number of clients disconnected.
+    """
+    stale = []
+    for websocket in heartbeats.due(now):
+        client_data = client_info.get(websocket)
+        if client_data is None:
+            continue  # already disconnected
+        deadline = client_data.last_heartbeat + HEARTBEAT_TIMEOUT
+        if deadline > now:
+            heartbeats.schedule(websocket, deadline)
+        else:
+            stale.append(websocket)
     
-    for client in clients.copy():  # Use copy to avoid modification during iteration
-        success = await safe_send(client, message)
-        if not success:
-            failed_clients.append(client)
+    updated_rooms = {}
+    for websocket in stale:
+        client_data = client_info[websocket]
+        logger.warning("Client %s heartbeat timeout", client_data.username)
+        if cleanup_client(websocket, broadcast=False):
+            updated_rooms[client_data.room] = None
+        asyncio.create_task(websocket.close(code=1001, reason="Heartbeat timeout"))
     
-    # Clean up failed clients
-    for client in failed_clients:
-        await cleanup_client(client)
+    for room in updated_rooms:
+        room.update_presence()
+    return len(stale)
 
-async def broadcast_to_clients(message):
-    """Broadcast a message to all non-host clients"""
-    if not clients:
-        return
-        
-    failed_clients = []
-    for client in clients.copy():
-        if client != host_socket:  # Don't send to host
-            success = await safe_send(client, message)
-            if not success:
-                failed_clients.append(client)
-    
-    for client in failed_clients:
-        await cleanup_client(client)
+last_loop_lag = 0.0
+
+async def loop_lag_probe():
+    """Measure how late the event loop runs a timer, i.e. how long callbacks hold it up"""
+    global last_loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        last_loop_lag = max(0.0, loop.time() - expected)
+        LOOP_LAG.observe(last_loop_lag)
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a background thread while started
+
+    Results are collapsed stacks, one "outermost;...;innermost count" line per
+    distinct stack, the input format of flame graph tools. Sampling stops on
+    its own after PROFILE_MAX_SECONDS; when stopped it costs nothing.
+    """
+
+    def __init__(self):
+        self.samples = Counter()
+        self.stopping: Optional[threading.Event] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, thread_id):
+        self.samples = Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample, args=(thread_id, self.stopping),
+                                       name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks, most sampled first"""
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def sample(self, thread_id, stopping):
+        deadline = time.monotonic() + PROFILE_MAX_SECONDS
+        while not stopping.wait(PROFILE_INTERVAL) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+profiler = SamplingProfiler()
+
+def scrape_gauges():
+    """Current values of the gauges served with the metrics"""
+    outboxes = [info.outbox for info in client_info.values()]
+    gauges = [
+        ("jeopardy_connections", "Open WebSocket connections of hosts and players", len(client_info)),
+        ("jeopardy_spectators", "Open spectator connections", sum(len(room.spectators) for room in rooms.values())),
+        ("jeopardy_rooms", "Rooms open", len(rooms)),
+        ("jeopardy_outbox_frames", "Frames queued in all outboxes", sum(outbox.depth() for outbox in outboxes)),
+        ("jeopardy_outbox_frames_max", "Frames queued in the most backed-up outbox",
+         max((outbox.depth() for outbox in outboxes), default=0)),
+        ("jeopardy_outbox_bytes", "Bytes queued in all outboxes", sum(outbox.size for outbox in outboxes)),
+        ("jeopardy_event_loop_lag_last_seconds", "Lag measured by the latest event-loop probe", last_loop_lag),
+        ("jeopardy_drawing_store_bytes", "Bytes of drawings kept for DRAWING_FETCH", drawing_store.size),
+        ("jeopardy_compression_cache_bytes", "Bytes of compressed frames kept for reuse", compressed_frames.size),
+        ("jeopardy_media_cache_bytes", "Bytes of game pack media kept for MEDIA_FETCH", media_store.size),
+    ]
+    if game_journal is not None:
+        gauges.append(("jeopardy_journal_sequence", "Events appended to the game journal", game_journal.sequence))
+    return gauges
+
+def bearer_token_matches(headers, token) -> bool:
+    return hmac.compare_digest(headers.get('Authorization', '').encode(), f"Bearer {token}".encode())
+
+def http_response(connection, status, text):
+    """A plain-text HTTP response, for either websockets server API"""
+    if isinstance(connection, str):  # legacy API: process_request(path, headers)
+        return status, [("Content-Type", "text/plain; charset=utf-8")], text.encode()
+    return connection.respond(status, text)
+
+async def process_http_request(connection, request):
+    """Answer metrics and profiler requests on the game port
+
+    GET /metrics returns every metric in the Prometheus text format.
+    GET /profile?start starts the sampling profiler, /profile?stop stops it
+    and returns the collapsed stacks, and /profile reports whether it is
+    running; these need the host password as a bearer token. Any other
+    request goes on to the WebSocket handshake.
+    """
+    if isinstance(connection, str):
+        path, headers = connection, request
+    else:
+        path, headers = request.path, request.headers
+    path, _, query = path.partition('?')
+
+    if path == METRICS_PATH:
+        if METRICS_TOKEN and not bearer_token_matches(headers, METRICS_TOKEN):
+            return http_response(connection, HTTPStatus.UNAUTHORIZED, "Unauthorized\n")
+        return http_response(connection, HTTPStatus.OK, metrics.render(scrape_gauges()))
+
+    if path == PROFILE_PATH:
+        if not bearer_token_matches(headers, host_password):
+            return http_response(connection, HTTPStatus.UNAUTHORIZED, "Unauthorized\n")
+        action = next(iter(parse_qs(query, keep_blank_values=True)), '')
+        if action == 'start':
+            if profiler.running():
+                return http_response(connection, HTTPStatus.CONFLICT, "Profiler already running\n")
+            profiler.start(threading.get_ident())
+            logger.info("Sampling profiler started")
+            return http_response(connection, HTTPStatus.OK, "Profiler started\n")
+        if action == 'stop':
+            logger.info("Sampling profiler stopped")
+            return http_response(connection, HTTPStatus.OK, profiler.stop())
+        state = "running" if profiler.running() else "stopped"
+        return http_response(connection, HTTPStatus.OK, f"Profiler {state}, {sum(profiler.samples.values())} samples\n")
+    return None
 
 async def heartbeat_monitor():
     """Monitor client connections and remove stale ones"""
+    last_housekeeping = time.monotonic()
     while True:
         try:
-            current_time = time.time()
-            stale_clients = []
+            await asyncio.sleep(HEARTBEAT_TICK)
+            now = time.monotonic()
+            expire_stale_clients(now)
             
-            for websocket, client_data in client_info.items():
-                if current_time - client_data['last_heartbeat'] > HEARTBEAT_TIMEOUT:
-                    logger.warning(f"Client {client_data.get('username', 'unknown')} heartbeat timeout")
-                    stale_clients.append(websocket)
+            if now - last_housekeeping < HEARTBEAT_INTERVAL:
+                continue
+            last_housekeeping = now
             
-            for websocket in stale_clients:
-                try:
-                    await websocket.close()
-                except:
-                    pass
-                await cleanup_client(websocket)
+            reap_idle_rooms()
             
-            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            # Report clients whose outboxes are backing up
+            for entry in outbox_stats():
+                if entry['depth'] >= OUTBOX_WARN_FRAMES or entry['dropped']:
+                    logger.warning("Outbox backed up for %s: %s frames, %s bytes queued, %s dropped",
+                                   entry['username'], entry['depth'], entry['bytes'], entry['dropped'])
         except Exception as e:
-            logger.error(f"Error in heartbeat monitor: {e}")
-            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            logger.error("Error in heartbeat monitor: %s", e)
 
-async def main():
-    logger.info("Starting BCS Secure Jeopardy Server on port 9999")
+async def main(host="0.0.0.0", port=9999):
+    global game_journal
+    logger.info("Starting BCS Secure Jeopardy Server on port %s", port)
+    
+    # Pick up the games running when the server last stopped
+    if JOURNAL_DIR:
+        os.makedirs(JOURNAL_DIR, exist_ok=True)
+        game_journal = GameJournal(JOURNAL_DIR, recover_rooms(JOURNAL_DIR))
+        if any(room.buzz_queue for room in rooms.values()):
+            asyncio.get_running_loop().call_later(SESSION_RESUME_WINDOW, drop_unreturned_players)
     
-    # Start heartbeat monitor
+    # Start heartbeat monitor and the event-loop lag probe
     heartbeat_task = asyncio.create_task(heartbeat_monitor())
+    lag_task = asyncio.create_task(loop_lag_probe())
     
     try:
         # Start WebSocket server
         start_server = websockets.serve(
             handle_client, 
-            "0.0.0.0", 
-            9999,
-            ping_interval=20,  # Send ping every 20 seconds
-            ping_timeout=10    # Wait 10 seconds for pong
+            host, 
+            port,
+            ping_interval=KEEPALIVE_INTERVAL,
+            ping_timeout=KEEPALIVE_TIMEOUT,
+            process_request=process_http_request,
+            extensions=compression_extensions(),
+            compression=None
         )
         
         server = await start_server
@@ -538,13 +3101,194 @@ async def main():
         await asyncio.Future()
         
     except Exception as e:
-        logger.error(f"Server error: {e}")
+        logger.error("Server error: %s", e)
     finally:
         heartbeat_task.cancel()
+        lag_task.cancel()
+        if game_journal is not None:
+            game_journal.close()
+            game_journal = None
         logger.info("Server shutting down")
 
+def worker_for_room(code, workers) -> int:
+    """Stable room -> worker assignment, the same in every process"""
+    return zlib.crc32(code.encode()) % workers
+
+def worker_settings():
+    """Module configuration to carry into workers (spawned workers re-import this module)"""
+    return {
+        name: value for name, value in globals().items()
+        if name.isupper() and isinstance(value, (bool, int, float, str))
+    }
+
+def run_worker(index, port, settings):
+    """Entry point of a worker process: one event loop serving the rooms routed to it"""
+    global TRUST_FORWARDED_FOR, JOURNAL_DIR
+    globals().update(settings)
+    TRUST_FORWARDED_FOR = True
+    if JOURNAL_DIR:
+        JOURNAL_DIR = os.path.join(JOURNAL_DIR, f"worker{index}")
+    # Each worker rotates its own log; the router keeps LOG_FILE
+    configure_logging(f"{os.path.splitext(LOG_FILE)[0]}.worker{index}.log")
+    logger.info("Worker %s (pid %s) serving on 127.0.0.1:%s", index, os.getpid(), port)
+    try:
+        asyncio.run(serve_worker(port, os.getppid()))
+    except KeyboardInterrupt:
+        pass
+
+async def serve_worker(port, parent):
+    """Run main() until SIGTERM or until the router that started this worker is gone
+    
+    A router killed outright cannot stop its workers; without the parent
+    check they would keep the worker ports and the next router's workers
+    could not bind them.
+    """
+    server_task = asyncio.create_task(main("127.0.0.1", port))
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server_task.cancel)
+    except NotImplementedError:  # Windows event loops
+        pass
+    while not server_task.done():
+        if os.getppid() != parent:
+            logger.warning("Router (pid %s) is gone, stopping worker", parent)
+            server_task.cancel()
+            break
+        await asyncio.sleep(WORKER_PARENT_POLL)
+    try:
+        await server_task
+    except asyncio.CancelledError:
+        pass
+
+def start_worker(index, port):
+    process = multiprocessing.get_context('spawn').Process(
+        target=run_worker, args=(index, port, worker_settings()), name=f"worker-{index}", daemon=True
+    )
+    process.start()
+    return process
+
+async def pipe(reader, writer):
+    """Copy bytes one way until either side closes"""
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+async def route_connection(reader, writer, worker_ports):
+    """Forward one client connection to the worker that owns its room
+    
+    Only the HTTP upgrade request is parsed, to find the room code; after
+    that the router just copies bytes, so all game work happens in workers.
+    """
+    peer = writer.get_extra_info('peername')
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=10.0)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        writer.close()
+        return
+    
+    request_line, rest = head.split(b"\r\n", 1)
+    parts = request_line.decode('latin-1').split(' ')
+    code = room_code_from_path(parts[1] if len(parts) == 3 else '/')
+    index = worker_for_room(code, len(worker_ports))
+    
+    try:
+        upstream_reader, upstream_writer = await asyncio.open_connection('127.0.0.1', worker_ports[index])
+    except OSError as e:
+        logger.warning("Worker %s unavailable for room %s: %s", index, code, e)
+        writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        writer.close()
+        return
+    
+    # Tell the worker who the client really is
+    forwarded = f"X-Forwarded-For: {peer[0] if peer else 'unknown'}\r\n".encode('latin-1')
+    upstream_writer.write(request_line + b"\r\n" + forwarded + rest)
+    await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+async def supervise_workers(processes, worker_ports):
+    """Restart workers that exit, backing off when one keeps crashing"""
+    loop = asyncio.get_running_loop()
+    crashes = [0] * len(processes)
+    started = [loop.time()] * len(processes)
+    restart_at = [None] * len(processes)
+    while True:
+        await asyncio.sleep(1)
+        now = loop.time()
+        for index, process in enumerate(processes):
+            if process.is_alive():
+                if crashes[index] and now - started[index] > WORKER_STABLE_AFTER:
+                    crashes[index] = 0
+                continue
+            
+            if restart_at[index] is None:
+                delay = min(WORKER_RESTART_DELAY * 2 ** crashes[index], WORKER_MAX_RESTART_DELAY)
+                crashes[index] += 1
+                restart_at[index] = now + delay
+                logger.error("Worker %s exited with code %s, restarting in %.0fs", index, process.exitcode, delay)
+            elif now >= restart_at[index]:
+                processes[index] = start_worker(index, worker_ports[index])
+                started[index] = now
+                restart_at[index] = None
+
+async def run_router(host="0.0.0.0", port=9999, workers=2):
+    """Start worker processes behind a room-aware router on the public port
+    
+    Each room lives in exactly one worker, so SO_REUSEPORT (which spreads
+    connections by address, not by room) is not enough; the router reads
+    the room code from the upgrade request and forwards the connection.
+    """
+    # Spawned workers re-import this module; share the password explicitly
+    os.environ['HOST_PASSWORD'] = host_password
+    worker_ports = [WORKER_BASE_PORT + index for index in range(workers)]
+    processes = [start_worker(index, worker_port) for index, worker_port in enumerate(worker_ports)]
+    
+    # SIGTERM (a service or container stop) and SIGINT end the router through
+    # the finally below, so the workers are stopped rather than orphaned
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:  # Windows event loops; Ctrl+C still raises KeyboardInterrupt
+            pass
+    
+    supervisor = asyncio.create_task(supervise_workers(processes, worker_ports))
+    try:
+        router = await asyncio.start_server(
+            lambda reader, writer: route_connection(reader, writer, worker_ports),
+            host, port
+        )
+        logger.info("Routing port %s to %s workers on ports %s-%s", port, workers, worker_ports[0], worker_ports[-1])
+        async with router:
+            await stop.wait()
+    finally:
+        supervisor.cancel()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop, killing it", process.name)
+                process.kill()
+                process.join()
+        logger.info("Router shutting down")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BCS Secure Jeopardy Server")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes to spread rooms across (default 1: no router)")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        if args.workers > 1:
+            asyncio.run(run_router(port=args.port, workers=args.workers))
+        else:
+            asyncio.run(main(port=args.port))
     except KeyboardInterrupt:
         logger.info("Server stopped by user")